@@ -0,0 +1,130 @@
+import os
+import argparse
+import datetime
+import pandas as pd
+from storage import save_file, read_file
+from cleaning import CleanState, LEFT_HAND_SIDE_VARS
+from predict_data import KEY_VARS, load_window_models
+from portfolio_analysis_hackathon import monthly_portfolios, portfolio_metrics, turnover_count
+
+# Monthly update without the full recompute of `cleandata` / feature selection / `predict_data.py` / portfolio analysis:
+# 1. the persisted cleaning state (`cleaning.CleanState`) cleans only the rows of the new month
+# 2. the models of the latest window saved by `predict_data.py --save_models` score them
+# 3. the predictions file and the monthly portfolio returns are extended by that month, and the metrics recomputed
+#    from the (small) monthly series
+# The state is saved last and months already written are skipped, so a run that fails part way can simply be rerun.
+# The state only cleans point in time (`cleaning.POINT_IN_TIME`), so the models must come from a panel cleaned that way:
+# the scheme recorded next to the cleaned data file is saved with the models and checked before scoring.
+
+MONTHLY_PORT_FILE = 'monthly_port.csv'
+POSITIONS_FILE = 'positions.csv'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Clean, score and evaluate one new month of data.')
+    parser.add_argument('--new_data', type=str, required=True, help='Raw rows of the new month, format is picked from the extension (.csv, .parquet, .feather)')
+    parser.add_argument('--work_dir', type=str, default='', help='Working directory (optional)')
+    parser.add_argument('--state_dir', type=str, default='clean_state', help='Directory of the cleaning state and the portfolio series, relative to the working directory')
+    parser.add_argument('--init_raw', type=str, default='', help='Build the cleaning state from this raw history first, e.g. `hackathon_sample_v2.csv` (optional)')
+    parser.add_argument('--init_factor', type=str, default='factor_char_list.csv', help='With `--init_raw`, list of the raw factors')
+    parser.add_argument('--missing_values_percent_threshold', type=float, default=0.30, help='With `--init_raw`, keep factors with a lower share of missing values, as in `cleandata`')
+    parser.add_argument('--zero_values_percent_threshold', type=float, default=0.20, help='With `--init_raw`, keep factors with a lower share of zero values, as in `cleandata`')
+    parser.add_argument('--months_threshold', type=int, default=100, help='With `--init_raw`, keep stocks with at least this many months')
+    parser.add_argument('--models_dir', type=str, default='predictions/models', help='Models saved by `predict_data.py --save_models`, relative to the working directory')
+    parser.add_argument('--predicted', type=str, default='predictions/output.csv', help='Predictions file to extend, relative to the working directory')
+    parser.add_argument('--model', type=str, default='xgb', help='Model used for the portfolios')
+    parser.add_argument('--mkt_ind', type=str, default='mkt_ind.csv', help='Path to market factor CSV file')
+    return parser.parse_args()
+
+def check_factors(window: dict, state: CleanState):
+    # The models can only score rows cleaned the same way (scheme) and with (at least) the factors they were trained on
+    if window.get('cleaning') != state.SCHEME:
+        raise ValueError(f"The saved models were trained on a panel cleaned with {window.get('cleaning')} (None: not recorded), "
+                         f"the cleaning state cleans new months with {state.SCHEME}. Clean the panel with this point-in-time "
+                         f"scheme (`CLEANING` of the notebook) and rerun `predict_data.py --save_models`.")
+    missing = [name for name in window['stock_vars'] if name not in state.clean_factor]
+    if missing:
+        raise ValueError(f"The saved models use factors that the cleaning state does not keep: {missing}. Rebuild the state "
+                         f"with `--init_raw` and the thresholds of the cleaned panel the models were trained on.")
+
+def score_rows(window: dict, clean_rows: pd.DataFrame) -> pd.DataFrame:
+    # Same scaling and models as the window in `predict_data.py`, on the new rows only
+    values = clean_rows[window['stock_vars']].to_numpy(dtype=float)
+    scored = clean_rows[KEY_VARS].reset_index(drop=True)
+    for name, model in window['models'].items():
+        # A warm-started XGBoost keeps the scaling of its last full refit, its predictions are shifted to the window's target mean
+        center, scale, y_mean = window.get('model_scaling', {}).get(name, (window['center'], window['scale'], window['y_mean']))
+        scored[name] = model.predict((values - center) / scale) + y_mean - window['y_mean']
+    return scored
+
+def append_predictions(scored: pd.DataFrame, predicted_path: str):
+    if os.path.exists(predicted_path):
+        # Skip a month already appended by an interrupted run, keep the column order of the file
+        if scored['date'].isin(pd.read_csv(predicted_path, usecols=['date'], parse_dates=['date'])['date']).any():
+            print(f"`{predicted_path}` already holds {scored['date'].max():%Y-%m}.")
+            return
+        scored = scored[pd.read_csv(predicted_path, nrows=0).columns]
+    scored.to_csv(predicted_path, mode='a', header=not os.path.exists(predicted_path), index=False)
+    print(f"Appended {len(scored)} rows to `{predicted_path}`.")
+
+def extend_portfolios(scored: pd.DataFrame, predicted_path: str, state_dir: str, model: str):
+    monthly_path, positions_path = os.path.join(state_dir, MONTHLY_PORT_FILE), os.path.join(state_dir, POSITIONS_FILE)
+    if os.path.exists(monthly_path):
+        monthly_port, positions = read_file(monthly_path), read_file(positions_path, parse_dates=['date'])
+        if positions['date'].isin(scored['date']).any():
+            return monthly_port, positions
+        # Deciles are formed within each month, so only the new month is ranked
+        pred, new_port = monthly_portfolios(scored.copy(), model)
+        monthly_port = pd.concat([monthly_port, new_port], ignore_index=True)
+        positions = pd.concat([positions, pred[pred['rank'].isin([0, 9])][['permno', 'date', 'rank']]], ignore_index=True)
+    else:
+        # First run: the series of every month already in the predictions file
+        pred, monthly_port = monthly_portfolios(read_file(predicted_path, parse_dates=['date']), model)
+        positions = pred[pred['rank'].isin([0, 9])][['permno', 'date', 'rank']]
+    save_file(monthly_port, monthly_path)
+    save_file(positions, positions_path)
+    return monthly_port, positions
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    start_time = datetime.datetime.now()
+    work_dir = args.work_dir
+    state_dir = os.path.join(work_dir, args.state_dir)
+    os.makedirs(state_dir, exist_ok=True)
+    predicted_path = os.path.join(work_dir, args.predicted)
+
+    if args.init_raw:
+        input_factor = list(read_file(os.path.join(work_dir, args.init_factor))['variable'].values)
+        raw = read_file(os.path.join(work_dir, args.init_raw), parse_dates=['date'], columns=LEFT_HAND_SIDE_VARS + input_factor)
+        state = CleanState.from_raw(input_factor, raw, missing_values_percent_threshold=args.missing_values_percent_threshold,
+                                    zero_values_percent_threshold=args.zero_values_percent_threshold, months_threshold=args.months_threshold)
+        del raw
+    else:
+        state = CleanState.load(state_dir)
+
+    window = load_window_models(os.path.join(work_dir, args.models_dir))
+    check_factors(window, state)
+
+    # 1. Clean the new month
+    new_rows = read_file(os.path.join(work_dir, args.new_data), parse_dates=['date'], columns=LEFT_HAND_SIDE_VARS + state.input_factor)
+    clean_rows = state.append_month(new_rows)
+    print(f"Cleaned {len(clean_rows)} of {len(new_rows)} rows of {new_rows['date'].max():%Y-%m}.")
+
+    # 2. Score it with the latest window's models
+    scored = score_rows(window, clean_rows)
+    append_predictions(scored, predicted_path)
+
+    # 3. Extend the portfolio series and recompute the metrics
+    monthly_port, positions = extend_portfolios(scored, predicted_path, state_dir, args.model)
+    metrics = portfolio_metrics(monthly_port, pd.read_csv(args.mkt_ind), verbose=False)
+    for name, value in metrics.items():
+        print(f"{name}:", value)
+    print("Long Portfolio Turnover:", turnover_count(positions[positions['rank'] == 9]))
+    print("Short Portfolio Turnover:", turnover_count(positions[positions['rank'] == 0]))
+
+    save_file(clean_rows, os.path.join(state_dir, f"clean_{new_rows['date'].max():%Y%m}.csv"))
+    state.save(state_dir)
+
+    duration = datetime.datetime.now() - start_time
+    print(f"Total Time: {int(duration.total_seconds() // 60):02}:{int(duration.total_seconds() % 60):02}")
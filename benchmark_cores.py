@@ -0,0 +1,84 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from storage import save_file
+from panel_cache import Panel, build_panel_cache, open_panel, save_panel
+from predict_data import inputData, expanding_windows, run_window, init_worker, run_worker_window, WindowBuffers
+from scheduler import CoreBudget
+
+# Throughput of `predict_data.py` windows for different splits of the same core budget, e.g. on 8 cores:
+#   python benchmark_cores.py --cores 8 --splits oversubscribed,1x1,2x1,4x1,1x4 --xgb_matrix sklearn
+# A split `AxB` runs A windows in parallel processes and B GridSearchCV candidates at the same time in each of them
+# (`--jobs A --grid_jobs B`), the XGBoost / BLAS threads get the rest of the cores. `oversubscribed` is one window
+# with every library using all the cores, as without the budget.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark core budget splits of predict_data.py.')
+    parser.add_argument('--data', type=str, default='data.csv', help='Path to the data file, format is picked from the extension (.csv, .parquet, .feather)')
+    parser.add_argument('--factor', type=str, default='factor.csv', help='Path to the factor file, format is picked from the extension (.csv, .parquet, .feather)')
+    parser.add_argument('--work_dir', type=str, default='', help='Working directory (optional)')
+    parser.add_argument('--cache', type=str, default='', help='Memory-mapped panel cache directory, relative to the working directory (optional)')
+    parser.add_argument('--cores', type=int, default=0, help='Total core budget (0 = all cores)')
+    parser.add_argument('--splits', type=str, default='oversubscribed,1x1,2x1', help='Comma-separated `windows x grid jobs` splits, or `oversubscribed`')
+    parser.add_argument('--windows', type=int, default=4, help='Number of windows (the first ones) trained by every split')
+    parser.add_argument('--xgb_matrix', type=str, default='quantized', choices=['quantized', 'sklearn'], help='XGBoost grid search of `predict_data.py`')
+    parser.add_argument('--output', type=str, default='', help='Save the results table to this file (optional)')
+    return parser.parse_args()
+
+def parse_split(split: str, cores: int) -> CoreBudget:
+    if split == 'oversubscribed':
+        return CoreBudget(cores=cores, oversubscribe=True)
+    windows, grid_jobs = (int(value) for value in split.lower().split('x'))
+    return CoreBudget(cores=cores, windows=windows, grid_jobs=grid_jobs)
+
+def run_split(panel_source, panel: Panel, windows: list, budget: CoreBudget, xgb_matrix: str) -> float:
+    # Seconds to train and predict `windows` with the budget, the same way as `predict_data.py`
+    model_options = {'xgb_matrix': xgb_matrix, 'budget': budget}
+    start = time.perf_counter()
+    if budget.windows > 1:
+        with ProcessPoolExecutor(max_workers=budget.windows, initializer=init_worker,
+                                 initargs=(panel_source, budget.window_cores, model_options)) as executor:
+            list(executor.map(run_worker_window, windows))
+    else:
+        buffers = WindowBuffers(len(panel.stock_vars), capacity=len(panel))
+        for cutoff in windows:
+            run_window(panel, cutoff, buffers, **model_options, xgb_state={})
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    data_path, factor_path = os.path.join(args.work_dir, args.data), os.path.join(args.work_dir, args.factor)
+    if args.cache:
+        panel_source = os.path.join(args.work_dir, args.cache)
+        panel = build_panel_cache(factor_file=factor_path, data_file=data_path, cache_dir=panel_source, ret_var='stock_exret')
+    else:
+        stock_vars, data = inputData(factor_file=factor_path, data_file=data_path)
+        # Written to a temporary cache shared by the workers of every split, as `predict_data.py --jobs` does
+        panel_source = tempfile.mkdtemp(prefix='panel_cache_', dir=args.work_dir or None)
+        save_panel(Panel.from_frame(data, stock_vars, 'stock_exret'), panel_source)
+        panel = open_panel(panel_source)
+        del data
+
+    windows = expanding_windows(pd.to_datetime("20000101", format="%Y%m%d"), pd.to_datetime("20240101", format="%Y%m%d"))[:args.windows]
+
+    results = []
+    for split in args.splits.split(','):
+        budget = parse_split(split.strip(), args.cores)
+        seconds = run_split(panel_source, panel, windows, budget, args.xgb_matrix)
+        grid_jobs, threads = budget.plan('xgb_grid') if args.xgb_matrix == 'sklearn' else (1, budget.threads('xgb'))
+        results.append((split.strip(), budget.windows, grid_jobs, threads, seconds, len(windows) / seconds * 3600))
+        print(f"[{split.strip()}] {budget.describe()} | {seconds:.1f}s")
+
+    results = pd.DataFrame(results, columns=['Split', 'Windows', 'Grid jobs', 'XGBoost threads', 'Seconds', 'Windows per hour'])
+    print(results.to_string(index=False))
+    if args.output:
+        save_file(results, args.output)
+    if not args.cache:
+        del panel
+        shutil.rmtree(panel_source, ignore_errors=True)
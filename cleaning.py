@@ -0,0 +1,516 @@
+import os
+import json
+import glob
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from storage import read_chunks, FrameAppender
+
+# Array implementation of `cleandata` (main_notebook.py, section 2.4) for the same steps and the same output:
+# the rows are grouped by stock once and every per-stock step (all-missing filter, month counts, median imputation,
+# dense ranking and normalization) is a segment reduction over all factors at once, instead of pandas groupby
+# callbacks and transforms that each allocate another full copy of the panel.
+# `cleandata_out_of_core` runs the same steps over a raw file larger than memory, in two chunked passes.
+
+LEFT_HAND_SIDE_VARS = ['year', 'month', 'date', 'permno', 'comp_name', 'stock_exret'] # those are not part of the factors, but should be kept
+
+# Cleaning scheme of a saved panel, in a `<data file>.cleaning.json` next to it. Models trained on the panel can only
+# score new rows normalized the same way, `append_month.py` (point in time only) refuses any other scheme.
+POINT_IN_TIME = {'rank_by': 'date', 'impute': 'expanding'}
+
+def save_cleaning_scheme(data_file, rank_by='permno', impute='median'):
+    with open(data_file + '.cleaning.json', 'w') as f:
+        json.dump({'rank_by': rank_by, 'impute': impute}, f)
+
+def read_cleaning_scheme(data_file):
+    # None for a panel saved without its scheme
+    if not os.path.exists(data_file + '.cleaning.json'):
+        return None
+    with open(data_file + '.cleaning.json') as f:
+        return json.load(f)
+
+
+def _segments(codes: np.ndarray):
+    # Row order grouping equal codes together (stable, so rows keep their order inside a group) and group boundaries
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    return order, starts, sizes
+
+def segment_sort(values: np.ndarray, segment_of_row: np.ndarray):
+    # `values` is factor-major (factors x rows). Per factor, the row order by (segment, value) with NaN last inside
+    # each segment: one batched sort of all factors by value, then a stable one by segment
+    # (a radix sort when the segment codes fit in 16 bits, e.g. the stocks of a panel or its months)
+    by_value = np.argsort(values, axis=1)
+    segment_of_row = segment_of_row.astype(np.min_scalar_type(segment_of_row.max(initial=0)))
+    by_segment = np.argsort(segment_of_row[by_value], axis=1, kind='stable')
+    order = np.take_along_axis(by_value, by_segment, axis=1)
+    return order, np.take_along_axis(values, order, axis=1)
+
+def _restart(cumulative: np.ndarray, starts: np.ndarray, sizes: np.ndarray):
+    # Turn a running count along the rows into a count restarting at every segment
+    return cumulative - np.repeat(cumulative[:, starts], sizes, axis=1)
+
+def _dense_ranks(sorted_values: np.ndarray, starts: np.ndarray, sizes: np.ndarray):
+    # Dense rank (from 0) of the non-NaN sorted values and the max rank of every segment, NaN never starts a new value
+    missing = np.isnan(sorted_values)
+    new_value = np.ones(sorted_values.shape, dtype=np.int64)
+    new_value[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    new_value[:, starts] = 1
+    new_value[missing] = 0
+    ranks = _restart(np.cumsum(new_value, axis=1), starts, sizes)
+    ends = np.broadcast_to(starts + sizes - 1, (len(ranks), len(starts)))
+    return ranks, np.take_along_axis(ranks, ends, axis=1), missing
+
+def _scale_ranks(ranks: np.ndarray, max_ranks: np.ndarray) -> np.ndarray:
+    # Ranks to [-1, 1], 0 where the segment has a single distinct value
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normalized = ranks / max_ranks * 2 - 1
+    normalized[max_ranks == 0] = 0
+    return normalized
+
+def _unsort(sorted_result: np.ndarray, order: np.ndarray) -> np.ndarray:
+    result = np.empty_like(sorted_result)
+    np.put_along_axis(result, order, sorted_result, axis=1)
+    return result
+
+def _group_codes(groups):
+    codes = pd.factorize(np.asarray(groups))[0]
+    _, starts, sizes = _segments(codes)
+    return codes, starts, sizes
+
+def rank_normalize(values: np.ndarray, groups) -> np.ndarray:
+    """Dense rank of every factor within each group, scaled to [-1, 1]
+
+    `values` is rows x factors and `groups` the group of every row: `permno` ranks each stock through time,
+    `date` ranks the stocks of each month against each other (cross-sectional, point in time). All factors are
+    ranked by one batched sort; a group with a single distinct value gets 0 and NaN stays NaN.
+    """
+    codes, starts, sizes = _group_codes(groups)
+    order, sorted_values = segment_sort(np.ascontiguousarray(np.asarray(values, dtype=float).T), codes)
+    ranks, max_ranks, missing = _dense_ranks(sorted_values, starts, sizes)
+    normalized = _scale_ranks(ranks.astype(float), np.repeat(max_ranks, sizes, axis=1))
+    normalized[missing] = np.nan
+    return _unsort(normalized, order).T
+
+def _segment_medians(sorted_values: np.ndarray, starts: np.ndarray):
+    # Median of the non-NaN part of every segment, from its middle element(s), with the positions of the two middles
+    counts = np.add.reduceat(~np.isnan(sorted_values), starts, axis=1)
+    low = starts + np.maximum(counts - 1, 0) // 2
+    high = starts + np.maximum(counts, 1) // 2
+    below, above = np.take_along_axis(sorted_values, low, axis=1), np.take_along_axis(sorted_values, high, axis=1)
+    median = (below + above) / 2
+    median[counts == 0] = np.nan
+    return median, below, above, low
+
+def median_fill(values: np.ndarray, groups) -> np.ndarray:
+    # Missing values (rows x factors) filled with the median of their group, like `fillna(groupby(groups).transform('median'))`
+    codes, starts, sizes = _group_codes(groups)
+    values = np.ascontiguousarray(np.asarray(values, dtype=float).T)
+    _, sorted_values = segment_sort(values, codes)
+    median, _, _, _ = _segment_medians(sorted_values, starts)
+    return np.where(np.isnan(values), median[:, codes], values).T
+
+def _kth_smallest(tree: np.ndarray, base: np.ndarray, k: np.ndarray, top: int) -> np.ndarray:
+    # 0-based rank of the k-th (from 0) smallest value in the Fenwick trees starting at `base` of the flat `tree`, by binary lifting
+    position, remaining = np.zeros_like(k), k + 1
+    size = 2 * top - 1
+    step = top
+    while step:
+        following = position + step
+        inside = following <= size
+        count = np.where(inside, tree[base + np.minimum(following, size)], 0)
+        move = inside & (count < remaining)
+        position = np.where(move, following, position)
+        remaining = np.where(move, remaining - count, remaining)
+        step >>= 1
+    return position
+
+def expanding_median_fill(values: np.ndarray, groups, times, max_cells=1 << 24) -> np.ndarray:
+    """Missing values (rows x factors) filled with the median of their group's values up to that time (point in time)
+
+    A missing value gets the median of the non-missing values of its group with `times` up to its own, and stays
+    NaN when there is none yet. Every (group, factor) series has a Fenwick tree over the ranks of its values:
+    each time step inserts the new values and reads the two middle order statistics of all series at once, so the
+    whole panel costs O(n log T) for T time steps instead of one median per month. Factors are processed in batches
+    of at most `max_cells` tree cells.
+    """
+    values = np.asarray(values, dtype=float)
+    codes = pd.factorize(np.asarray(groups))[0]
+    row_order = np.lexsort((np.asarray(times), codes))
+    codes = codes[row_order]
+    _, starts, sizes = _segments(codes)
+
+    # Factor-major values with the rows of each group in time order, and the rank of every value in its series
+    series_values = np.ascontiguousarray(values[row_order].T)
+    order, sorted_values = segment_sort(series_values, codes)
+    within = np.broadcast_to(np.arange(len(codes)) - np.repeat(starts, sizes), order.shape)
+    value_rank = np.empty_like(order)
+    np.put_along_axis(value_rank, order, within, axis=1)
+
+    n_factors, n_series, length = len(series_values), len(sizes), int(sizes.max(initial=0))
+    missing = np.isnan(series_values)
+    filled = series_values.copy()
+    # Trees of 2^k - 1 >= length positions, so binary lifting never leaves a tree
+    top = 1 << (length.bit_length() - 1) if length else 0
+    size = 2 * top - 1
+    batch = max(1, max_cells // (n_series * (size + 1) or 1))
+
+    for first in range(0, n_factors, batch):
+        factors = np.arange(first, min(first + batch, n_factors))
+        # Flat array of the trees of every (factor, series) pair of the batch, tree `i` starts at `i * (size + 1)`
+        tree = np.zeros(len(factors) * n_series * (size + 1), dtype=np.int32)
+        counts = np.zeros((len(factors), n_series), dtype=np.int64)
+        batch_missing = missing[factors]
+
+        for t in range(length):
+            series = np.flatnonzero(sizes > t)
+            rows = starts[series] + t
+            step_missing = batch_missing[:, rows]
+
+            # Insert the values observed at `t`
+            factor, column = np.nonzero(~step_missing)
+            counts[factor, series[column]] += 1
+            base = (factor * n_series + series[column]) * (size + 1)
+            index = value_rank[factors[factor], rows[column]] + 1
+            while len(index):
+                tree[base + index] += 1
+                index = index + (index & -index)
+                inside = index <= size
+                base, index = base[inside], index[inside]
+
+            # Fill the values missing at `t` with the median of what was observed so far
+            factor, column = np.nonzero(step_missing)
+            count = counts[factor, series[column]]
+            observed = count > 0
+            factor, column, count = factor[observed], column[observed], count[observed]
+            if len(count):
+                base = (factor * n_series + series[column]) * (size + 1)
+                low = _kth_smallest(tree, base, (count - 1) // 2, top)
+                high = _kth_smallest(tree, base, count // 2, top)
+                factor_rows, offset = factors[factor], starts[series[column]]
+                filled[factor_rows, rows[column]] = (sorted_values[factor_rows, offset + low]
+                                                     + sorted_values[factor_rows, offset + high]) / 2
+
+    result = np.empty_like(values)
+    result[row_order] = filled.T
+    return result
+
+def median_fill_rank_normalize(values: np.ndarray, segment_of_row: np.ndarray, starts: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """Fill NaN with the segment median, dense rank within the segment and scale the ranks to [-1, 1]
+
+    Same result as `median_fill` followed by `rank_normalize` on the same groups, from a single sort: the rank
+    of the filled value (and the shift of the larger values when it is a new distinct value) is derived from
+    the two middle neighbours it is the average of.
+    """
+    order, sorted_values = segment_sort(values, segment_of_row)
+    ranks, max_ranks, missing = _dense_ranks(sorted_values, starts, sizes)
+    median, below, above, low = _segment_medians(sorted_values, starts)
+    below_rank = np.take_along_axis(ranks, low, axis=1)
+
+    # Filled values rank right after `below` (or tie with it), and push the values above up by one if they are a new value
+    filled = np.add.reduceat(missing, starts, axis=1) > 0
+    new_median = filled & (median != below) & (median != above)
+    ranks = ranks + (np.repeat(new_median, sizes, axis=1) & (ranks > np.repeat(below_rank, sizes, axis=1)))
+    ranks = np.where(missing, np.repeat(below_rank + (median > below), sizes, axis=1), ranks).astype(float)
+
+    normalized = _scale_ranks(ranks, np.repeat(max_ranks + new_median, sizes, axis=1))
+    normalized[np.repeat(np.isnan(median), sizes, axis=1)] = np.nan
+    return _unsort(normalized, order)
+
+
+def keep_factors(missing_counts, zero_counts, total_entries, missing_values_percent_threshold=0.30, zero_values_percent_threshold=0.20):
+    # Mask of the factors with fewer missing and zero values than the thresholds
+    return ((np.asarray(missing_counts) < total_entries * missing_values_percent_threshold)
+            & (np.asarray(zero_counts) < total_entries * zero_values_percent_threshold))
+
+def select_factors(raw: pd.DataFrame, input_factor: list, missing_values_percent_threshold=0.30, zero_values_percent_threshold=0.20):
+    # Factors with fewer missing and zero values than the thresholds, in the order of `input_factor`
+    values = raw[input_factor].to_numpy(dtype=float)
+    keep = keep_factors(np.isnan(values).sum(axis=0), (values == 0).sum(axis=0), len(values),
+                        missing_values_percent_threshold, zero_values_percent_threshold)
+    return [factor for factor, kept in zip(input_factor, keep) if kept]
+
+def select_stock_rows(raw: pd.DataFrame, clean_factor: list, months_threshold=100) -> np.ndarray:
+    # Mask of the rows of the stocks kept: no factor entirely missing, and at least `months_threshold` months
+    values = raw[clean_factor].to_numpy(dtype=float)
+    codes = pd.factorize(raw['permno'])[0]
+    order, starts, sizes = _segments(codes)
+    available = np.add.reduceat(~np.isnan(values[order]), starts, axis=0)
+    keep_stock = (available > 0).all(axis=1) & (sizes >= months_threshold)
+    return keep_stock[codes]
+
+def _clean_stock_rows(data: pd.DataFrame, clean_factor: list, rank_by='permno', impute='median') -> pd.DataFrame:
+    # FILLING MISSING VALUES with the median of the stock, RANKING AND NORMALIZATION to [-1, 1] within each `rank_by` group
+    # (`data` only holds selected stocks, each one with all of its rows)
+    values = data[clean_factor].to_numpy(dtype=float)
+    if impute == 'expanding':
+        # Point in time: values missing before the stock's first observation are left at 0, the middle of the range
+        values = rank_normalize(expanding_median_fill(values, data['permno'], data['date']), data[rank_by])
+        values[np.isnan(values)] = 0
+    elif rank_by == 'permno':
+        # Both steps on the same groups share one sort
+        codes, starts, sizes = _group_codes(data['permno'])
+        values = median_fill_rank_normalize(np.ascontiguousarray(values.T), codes, starts, sizes).T
+    else:
+        values = rank_normalize(median_fill(values, data['permno']), data[rank_by])
+
+    clean_data = data[LEFT_HAND_SIDE_VARS].copy()
+    clean_data[clean_factor] = values
+    return clean_data
+
+def cleandata_vectorized(input_factor: list,
+                         raw: pd.DataFrame,
+                         missing_values_percent_threshold=0.30, # Keep factors that have lower missing values percentage than this
+                         zero_values_percent_threshold=0.20, # Keep factors that have lower zero values percentage than this
+                         months_threshold=100, # Keep stocks that have higher number of months data than this
+                         rank_by='permno', # Rank each stock through time ('permno') or the stocks of each month ('date')
+                         impute='median' # Fill with the stock's full-history median ('median') or its median up to each month ('expanding')
+                         ):
+
+    # SELECT FACTORS
+    clean_factor = select_factors(raw, input_factor, missing_values_percent_threshold, zero_values_percent_threshold)
+
+    # SELECT STOCKS
+    keep_rows = select_stock_rows(raw, clean_factor, months_threshold)
+
+    return clean_factor, _clean_stock_rows(raw.loc[keep_rows, LEFT_HAND_SIDE_VARS + clean_factor], clean_factor, rank_by, impute)
+
+class CleanStats:
+    """Factor and stock counts behind the `cleandata` selection, computed once to try many thresholds
+
+    `sweep` reports the factors, stocks and rows kept by every combination of thresholds from these counts only,
+    and `materialize` cleans the panel for the chosen combination.
+    """
+
+    def __init__(self, input_factor: list, raw: pd.DataFrame):
+        self.input_factor = list(input_factor)
+        values = raw[self.input_factor].to_numpy(dtype=float)
+        self.total_entries = len(values)
+        self.missing_counts = np.isnan(values).sum(axis=0)
+        self.zero_counts = (values == 0).sum(axis=0)
+
+        # Rows and non-missing values of every stock and factor
+        self.codes, self.permnos = pd.factorize(raw['permno'])
+        order, starts, self.month_counts = _segments(self.codes)
+        self.available = np.add.reduceat(~np.isnan(values[order]), starts, axis=0)
+
+    def factor_mask(self, missing_values_percent_threshold=0.30, zero_values_percent_threshold=0.20) -> np.ndarray:
+        return keep_factors(self.missing_counts, self.zero_counts, self.total_entries, missing_values_percent_threshold, zero_values_percent_threshold)
+
+    def select(self, missing_values_percent_threshold=0.30, zero_values_percent_threshold=0.20, months_threshold=100):
+        # Factors and stocks kept by `cleandata` with these thresholds
+        factors = self.factor_mask(missing_values_percent_threshold, zero_values_percent_threshold)
+        stocks = (self.available[:, factors] > 0).all(axis=1) & (self.month_counts >= months_threshold)
+        return [factor for factor, kept in zip(self.input_factor, factors) if kept], self.permnos[stocks]
+
+    def sweep(self, missing_values_percent_thresholds=(0.30,), zero_values_percent_thresholds=(0.20,), months_thresholds=(100,)) -> pd.DataFrame:
+        """Number of factors, stocks and rows kept for every combination of the thresholds"""
+        grid = pd.MultiIndex.from_product([missing_values_percent_thresholds, zero_values_percent_thresholds],
+                                          names=['missing_values_percent_threshold', 'zero_values_percent_threshold'])
+        factors = np.array([self.factor_mask(missing, zero) for missing, zero in grid])
+
+        # A stock is dropped when one of the kept factors is entirely missing for it: one product for all factor sets
+        complete = ((self.available == 0).astype(np.int64) @ factors.T.astype(np.int64)) == 0
+        months = self.month_counts[:, None] >= np.asarray(months_thresholds)[None, :]
+        kept = complete[:, :, None] & months[:, None, :]
+
+        return pd.DataFrame({
+            'missing_values_percent_threshold': np.repeat(grid.get_level_values(0), len(months_thresholds)),
+            'zero_values_percent_threshold': np.repeat(grid.get_level_values(1), len(months_thresholds)),
+            'months_threshold': np.tile(months_thresholds, len(grid)),
+            'factors': np.repeat(factors.sum(axis=1), len(months_thresholds)),
+            'stocks': kept.sum(axis=0).ravel(),
+            'rows': np.einsum('s,sgm->gm', self.month_counts, kept).ravel(),
+        })
+
+    def materialize(self, raw: pd.DataFrame, missing_values_percent_threshold=0.30, zero_values_percent_threshold=0.20,
+                    months_threshold=100, rank_by='permno', impute='median'):
+        # Same output as `cleandata_vectorized` with these thresholds, `raw` must be the panel the counts were computed on
+        clean_factor, permnos = self.select(missing_values_percent_threshold, zero_values_percent_threshold, months_threshold)
+        keep_rows = np.isin(self.codes, self.permnos.get_indexer(permnos))
+        return clean_factor, _clean_stock_rows(raw.loc[keep_rows, LEFT_HAND_SIDE_VARS + clean_factor], clean_factor, rank_by, impute)
+
+def cleandata_out_of_core(input_factor: list,
+                          raw_file: str,
+                          data_file: str,
+                          missing_values_percent_threshold=0.30,
+                          zero_values_percent_threshold=0.20,
+                          months_threshold=100,
+                          chunksize=500_000, # Rows read at a time from `raw_file`
+                          n_partitions=32, # Stocks are spread over this many partitions by permno
+                          spill_dir=None, # Directory of the partitions, a temporary one next to `data_file` by default
+                          impute='median'
+                          ) -> list:
+    """Two-pass `cleandata` for a raw file larger than memory, the cleaned panel is written to `data_file`
+
+    Pass 1 reads `raw_file` in chunks, counts the missing/zero values of every factor and the rows and non-missing
+    values of every stock, and spills the rows into partitions by permno. Pass 2 cleans one partition at a time
+    (each stock is whole inside its partition) and appends it to `data_file`. The peak memory is one chunk or one
+    partition, and the rows come out grouped by partition instead of in the order of `raw_file`.
+    """
+    temporary = spill_dir is None
+    spill_dir = spill_dir or tempfile.mkdtemp(prefix='cleandata_', dir=os.path.dirname(os.path.abspath(data_file)))
+    os.makedirs(spill_dir, exist_ok=True)
+    input_factor = list(input_factor)
+
+    try:
+        # PASS 1: factor and stock statistics, partitions by permno
+        missing_counts, zero_counts, total_entries = np.zeros(len(input_factor)), np.zeros(len(input_factor)), 0
+        stock_rows, stock_available = pd.Series(dtype=float), pd.DataFrame(columns=input_factor, dtype=float)
+        for chunk_id, chunk in enumerate(read_chunks(raw_file, chunksize, parse_dates=['date'], columns=LEFT_HAND_SIDE_VARS + input_factor)):
+            values = chunk[input_factor].to_numpy(dtype=float)
+            missing_counts += np.isnan(values).sum(axis=0)
+            zero_counts += (values == 0).sum(axis=0)
+            total_entries += len(values)
+
+            by_stock = chunk.groupby('permno')
+            stock_rows = stock_rows.add(by_stock.size(), fill_value=0)
+            stock_available = stock_available.add(by_stock[input_factor].count(), fill_value=0)
+
+            partition = chunk['permno'].to_numpy() % n_partitions
+            for p in np.unique(partition):
+                chunk[partition == p].to_parquet(os.path.join(spill_dir, f'{p}-{chunk_id:06d}.parquet'), index=False)
+
+        # SELECT FACTORS and STOCKS from the statistics
+        keep = keep_factors(missing_counts, zero_counts, total_entries, missing_values_percent_threshold, zero_values_percent_threshold)
+        clean_factor = [factor for factor, kept in zip(input_factor, keep) if kept]
+        select_permno = stock_rows.index[(stock_available[clean_factor] > 0).all(axis=1) & (stock_rows >= months_threshold)]
+
+        # PASS 2: clean every partition
+        with FrameAppender(data_file) as output:
+            for p in range(n_partitions):
+                parts = sorted(glob.glob(os.path.join(spill_dir, f'{p}-*.parquet')))
+                if not parts:
+                    continue
+                data = pd.concat([pd.read_parquet(part, columns=LEFT_HAND_SIDE_VARS + clean_factor) for part in parts], ignore_index=True)
+                data = data[data['permno'].isin(select_permno)]
+                if len(data):
+                    output.append(_clean_stock_rows(data, clean_factor, impute=impute))
+        save_cleaning_scheme(data_file, impute=impute)
+    finally:
+        if temporary:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return clean_factor
+
+def check_parity(expected: pd.DataFrame, actual: pd.DataFrame, rtol=1e-12):
+    """Assert that two cleaned panels hold the same rows and values (factor columns may come in a different order)"""
+    assert set(expected.columns) == set(actual.columns), set(expected.columns) ^ set(actual.columns)
+    pd.testing.assert_frame_equal(expected, actual[expected.columns], check_dtype=False, rtol=rtol)
+
+
+class CleanState:
+    """Per-stock statistics of a point-in-time cleaned panel, to clean one new month at a time
+
+    Holds what `cleandata(..., impute='expanding', rank_by='date')` needs to clean the rows of a new month without
+    rereading the history: the factor and stock counts behind the selection, the selected factors and stocks,
+    and for every (factor, stock) the sorted values observed so far, whose middle is the expanding median.
+    Earlier rows never change in that scheme (the full-history median and per-stock ranks would rewrite all of them).
+    The selection stays fixed until the next full rebuild, the counts keep being updated for it.
+    Only models trained on a panel cleaned with `SCHEME` can score the rows it cleans.
+    """
+
+    STATE_FILE = 'clean_state.npz'
+    SCHEME = POINT_IN_TIME
+
+    def __init__(self, input_factor, clean_factor, thresholds, missing_counts, zero_counts, total_entries,
+                 month_counts: pd.Series, permnos, sorted_values, sizes, counts, last_date):
+        self.input_factor, self.clean_factor, self.thresholds = list(input_factor), list(clean_factor), list(thresholds)
+        self.missing_counts, self.zero_counts, self.total_entries = missing_counts, zero_counts, total_entries
+        self.month_counts = month_counts
+        self.permnos = np.asarray(permnos)
+        self.sorted_values, self.sizes, self.counts = sorted_values, sizes, counts
+        self.last_date = pd.Timestamp(last_date)
+
+    @classmethod
+    def from_raw(cls, input_factor: list, raw: pd.DataFrame, missing_values_percent_threshold=0.30,
+                 zero_values_percent_threshold=0.20, months_threshold=100):
+        input_factor = list(input_factor)
+        values = raw[input_factor].to_numpy(dtype=float)
+        clean_factor = select_factors(raw, input_factor, missing_values_percent_threshold, zero_values_percent_threshold)
+        selected = raw.loc[select_stock_rows(raw, clean_factor, months_threshold)]
+
+        codes, permnos = pd.factorize(selected['permno'])
+        _, starts, sizes = _segments(codes)
+        _, sorted_values = segment_sort(np.ascontiguousarray(selected[clean_factor].to_numpy(dtype=float).T), codes)
+        return cls(input_factor, clean_factor, [missing_values_percent_threshold, zero_values_percent_threshold, months_threshold],
+                   np.isnan(values).sum(axis=0), (values == 0).sum(axis=0), len(values), raw.groupby('permno').size(),
+                   permnos, sorted_values, sizes, np.add.reduceat(~np.isnan(sorted_values), starts, axis=1), raw['date'].max())
+
+    def _starts(self):
+        return np.concatenate([[0], np.cumsum(self.sizes)[:-1]])
+
+    def append_month(self, new_rows: pd.DataFrame) -> pd.DataFrame:
+        """Update the statistics with the raw rows of a new month and return those rows cleaned"""
+        if new_rows['date'].min() <= self.last_date:
+            raise ValueError(f"The state already holds data up to {self.last_date:%Y-%m-%d}, only later months can be appended.")
+
+        # Counts of the factor and stock selection
+        values = new_rows[self.input_factor].to_numpy(dtype=float)
+        self.missing_counts = self.missing_counts + np.isnan(values).sum(axis=0)
+        self.zero_counts = self.zero_counts + (values == 0).sum(axis=0)
+        self.total_entries += len(values)
+        self.month_counts = self.month_counts.add(new_rows.groupby('permno').size(), fill_value=0)
+        self.last_date = new_rows['date'].max()
+
+        # Rows of the selected stocks, in the order of the state
+        stock = pd.Index(self.permnos).get_indexer(new_rows['permno'])
+        rows = new_rows[stock >= 0].iloc[np.argsort(stock[stock >= 0], kind='stable')]
+        stock = np.sort(stock[stock >= 0])
+        if len(np.unique(stock)) < len(stock):
+            raise ValueError("A stock appears more than once in the appended month.")
+        new_values = np.ascontiguousarray(rows[self.clean_factor].to_numpy(dtype=float).T)
+
+        # FILLING MISSING VALUES with the median of the values observed before this month
+        starts = self._starts()[stock]
+        counts = self.counts[:, stock]
+        low = starts + np.maximum(counts - 1, 0) // 2
+        high = starts + np.maximum(counts, 1) // 2
+        median = (np.take_along_axis(self.sorted_values, low, axis=1) + np.take_along_axis(self.sorted_values, high, axis=1)) / 2
+        median[counts == 0] = np.nan
+        missing = np.isnan(new_values)
+        filled = np.where(missing, median, new_values)
+
+        # Insert the new values at their sorted place (binary search in the non-missing part), missing ones at the end
+        first, last = np.broadcast_to(starts, counts.shape).copy(), starts + counts
+        while (first < last).any():
+            searching = first < last
+            middle = (first + last) // 2
+            below = np.take_along_axis(self.sorted_values, np.minimum(middle, self.sorted_values.shape[1] - 1), axis=1) < new_values
+            first = np.where(searching & below, middle + 1, first)
+            last = np.where(searching & ~below, middle, last)
+        position = np.where(missing, starts + self.sizes[stock], first)
+        self.sorted_values = np.stack([np.insert(self.sorted_values[f], position[f], new_values[f]) for f in range(len(new_values))])
+        self.sizes[stock] += 1
+        self.counts[:, stock] += ~missing
+
+        # RANKING AND NORMALIZATION across the stocks of the month, values before the stock's first observation at 0
+        normalized = rank_normalize(filled.T, rows['date'])
+        normalized[np.isnan(normalized)] = 0
+        clean_rows = rows[LEFT_HAND_SIDE_VARS].copy()
+        clean_rows[self.clean_factor] = normalized
+        return clean_rows
+
+    def save(self, state_dir):
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, self.STATE_FILE)
+        np.savez(path + '.tmp.npz', input_factor=np.array(self.input_factor), clean_factor=np.array(self.clean_factor),
+                 thresholds=np.array(self.thresholds, dtype=float), missing_counts=self.missing_counts, zero_counts=self.zero_counts,
+                 total_entries=self.total_entries, month_permno=self.month_counts.index.to_numpy(), month_counts=self.month_counts.to_numpy(),
+                 permnos=self.permnos, sorted_values=self.sorted_values, sizes=self.sizes, counts=self.counts,
+                 last_date=np.datetime64(self.last_date, 'ns'))
+        # Replace the state atomically, so an interrupted save keeps the previous one
+        os.replace(path + '.tmp.npz', path)
+        print(f"Saved `{path}`.")
+
+    @classmethod
+    def load(cls, state_dir):
+        path = os.path.join(state_dir, cls.STATE_FILE)
+        print(f"Read `{path}`.")
+        with np.load(path) as state:
+            return cls(state['input_factor'].tolist(), state['clean_factor'].tolist(), state['thresholds'].tolist(),
+                       state['missing_counts'], state['zero_counts'], int(state['total_entries']),
+                       pd.Series(state['month_counts'], index=state['month_permno']), state['permnos'],
+                       state['sorted_values'], state['sizes'], state['counts'], state['last_date'][()])
@@ -0,0 +1,52 @@
+import numpy as np
+
+# Cross-validation folds of a training window on month boundaries, instead of `TimeSeriesSplit` / `KFold` cutting
+# the rows anywhere (splitting the stocks of a month between training and validation). The rows of a window are
+# sorted by date, so every fold is a few contiguous row ranges; the indices are computed once per window and the
+# same splitter is the `cv` of every model (sklearn's CV classes, GridSearchCV and both searches of `xgb_search.py`;
+# the year-block folds of `--linear=gram` cannot follow month blocks, so `predict_data.py` rejects the two together).
+# - `expanding`: like `TimeSeriesSplit`, the months are cut into `n_splits + 1` blocks and each fold validates on one
+#   block after training on all the months before it
+# - `blocked`: like an unshuffled `KFold`, each fold validates on one of `n_splits` blocks and trains on the others
+# Leakage around the validation block: `purge_months` months just before it and, for `blocked`,
+# `embargo_months` months just after it are left out of the training rows.
+
+
+def month_index(keys: dict, rows=slice(None)) -> np.ndarray:
+    # Consecutive month number of the rows, from the `year` / `month` keys of a panel
+    return keys['year'][rows].astype(np.int64) * 12 + keys['month'][rows].astype(np.int64) - 1
+
+class MonthFolds:
+    """Month-grouped folds of date-sorted rows, usable as the `cv` argument of sklearn estimators"""
+
+    def __init__(self, months: np.ndarray, n_splits: int = 3, scheme: str = 'expanding', purge_months: int = 1, embargo_months: int = 1):
+        months = np.asarray(months)
+        if scheme not in ('expanding', 'blocked'):
+            raise ValueError(f"Unknown scheme `{scheme}`, expected 'expanding' or 'blocked'.")
+        if np.any(np.diff(months) < 0):
+            raise ValueError("The rows must be sorted by month.")
+        n_months = len(np.unique(months))
+        n_blocks = n_splits + 1 if scheme == 'expanding' else n_splits
+        if n_months < n_blocks:
+            raise ValueError(f"{n_months} months cannot make {n_blocks} blocks.")
+
+        # First row of every month position, and month positions where each block starts
+        month_rows = np.append(np.flatnonzero(np.r_[True, months[1:] != months[:-1]]), len(months))
+        bounds = np.linspace(0, n_months, n_blocks + 1).astype(int)
+
+        self.splits = []
+        for block in range(1 if scheme == 'expanding' else 0, n_blocks):
+            first, last = bounds[block], bounds[block + 1]
+            test = np.arange(month_rows[first], month_rows[last])
+            train = np.arange(month_rows[max(0, first - purge_months)])
+            if scheme == 'blocked':
+                train = np.concatenate([train, np.arange(month_rows[min(n_months, last + embargo_months)], len(months))])
+            if not len(train):
+                raise ValueError(f"Fold {len(self.splits) + 1} has no training months left after the purge / embargo.")
+            self.splits.append((train, test))
+
+    def split(self, X=None, y=None, groups=None):
+        yield from self.splits
+
+    def get_n_splits(self, X=None, y=None, groups=None) -> int:
+        return len(self.splits)
@@ -0,0 +1,403 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
+from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
+from scipy.stats import rankdata
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import RobustScaler
+from sklearn.metrics import mean_squared_error, r2_score
+
+# Parallel runners for the feature selection of `main_notebook.py` (section 2.5).
+# Work is sent to joblib's process pool: large arrays are memory-mapped read-only into the workers instead of
+# copied to each of them, and the selectors can be plain functions defined in the notebook (cloudpickle).
+# The cores are split between the workers, each one limits its BLAS / OpenMP (XGBoost) threads to its share.
+
+
+def core_budget(n_tasks: int, n_jobs: int = -1):
+    # Processes to run and threads per process, so that processes x threads fits the cores
+    n_cores = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+    processes = max(1, min(n_tasks, n_cores))
+    return processes, max(1, n_cores // processes)
+
+def _run_selector(name, method, X, y, threads, columns=None):
+    # Selected columns of one selector and its duration, the selected data itself is not sent back
+    start = time.perf_counter()
+    X = X[columns] if columns is not None else X
+    with threadpool_limits(limits=threads):
+        selected = method(X, y)
+    return name, list(selected.columns), time.perf_counter() - start
+
+def run_selectors(selectors: dict, X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, columns: dict = None) -> dict:
+    """Run the selectors `{name: method(X, y) -> X[selected]}` at the same time on the same data
+
+    `columns` (`{name: factors}`) limits some of the selectors to a subset of the columns of `X`, sliced in the workers.
+
+    Returns the features of every method, their union (in order of appearance) and intersection,
+    and a timing table with the seconds, number of features and threads of every method.
+    """
+    processes, threads = core_budget(len(selectors), n_jobs)
+    start = time.perf_counter()
+    results = Parallel(n_jobs=processes, max_nbytes='1M', mmap_mode='r')(
+        delayed(_run_selector)(name, method, X, y, threads, (columns or {}).get(name)) for name, method in selectors.items())
+    wall_time = time.perf_counter() - start
+
+    features = {name: selected for name, selected, _ in results}
+    timing = pd.DataFrame([(name, seconds, len(selected), threads) for name, selected, seconds in results],
+                          columns=['Methods', 'Seconds', 'Features', 'Threads'])
+    print(f"{len(selectors)} selectors on {processes} processes x {threads} threads: {wall_time:.1f}s "
+          f"(sum of the methods {timing['Seconds'].sum():.1f}s)")
+
+    union = list(dict.fromkeys(feature for selected in features.values() for feature in selected))
+    intersection = [feature for feature in union if all(feature in selected for selected in features.values())]
+    return {'features': features, 'union': union, 'intersection': intersection, 'timing': timing, 'seconds': wall_time}
+
+
+# Homogeneous ensemble (stability selection): the same selector on many subsamples of the panel, each factor scored
+# by the share of subsamples that select it. A subsample is a draw of stocks (like the 50 stocks of
+# `load_and_extract_data`) or of blocks of consecutive months. The factors are memory-mapped once into the workers,
+# each task only receives the row indices of its subsample.
+
+def _subsample_rows(data, block, n_stocks, block_months, fraction, rng):
+    if block == 'stock':
+        permnos = data['permno'].unique()
+        return np.flatnonzero(data['permno'].isin(rng.choice(permnos, min(n_stocks, len(permnos)), replace=False)).to_numpy())
+    month = (data['year'] * 12 + data['month']).to_numpy()
+    blocks = (month - month.min()) // block_months
+    n_blocks = blocks.max() + 1
+    return np.flatnonzero(np.isin(blocks, rng.choice(n_blocks, max(1, int(round(fraction * n_blocks))), replace=False)))
+
+def _run_subsample(method, X, y, columns, rows, threads):
+    with threadpool_limits(limits=threads):
+        return list(method(pd.DataFrame(X[rows], columns=columns), pd.Series(y[rows])).columns)
+
+def stability_selection(method, data: pd.DataFrame, factors: list, target: str = 'stock_exret', n_subsamples: int = 100,
+                        block: str = 'stock', n_stocks: int = 50, block_months: int = 12, fraction: float = 0.5,
+                        threshold: float = 0.6, n_jobs: int = -1, random_state: int = 42) -> dict:
+    """Run `method(X, y) -> X[selected]` on `n_subsamples` subsamples of `data` in parallel
+
+    `block='stock'` draws `n_stocks` stocks per subsample, `block='time'` a `fraction` of the blocks of `block_months`
+    consecutive months. Returns the selection frequency of every factor, the factors selected at least `threshold`
+    of the time and the selection of each subsample.
+    """
+    if block not in ('stock', 'time'):
+        raise ValueError(f"Unknown block `{block}`, expected 'stock' or 'time'.")
+    rng = np.random.default_rng(random_state)
+    draws = [_subsample_rows(data, block, n_stocks, block_months, fraction, rng) for _ in range(n_subsamples)]
+    X, y = data[factors].to_numpy(dtype=float), data[target].to_numpy(dtype=float)
+
+    processes, threads = core_budget(n_subsamples, n_jobs)
+    start = time.perf_counter()
+    selections = Parallel(n_jobs=processes, max_nbytes='1M', mmap_mode='r')(
+        delayed(_run_subsample)(method, X, y, factors, rows, threads) for rows in draws)
+    wall_time = time.perf_counter() - start
+    print(f"{n_subsamples} {block} subsamples on {processes} processes x {threads} threads: {wall_time:.1f}s")
+
+    counts = pd.Series(0, index=factors) + pd.Series([f for selected in selections for f in selected]).value_counts()
+    frequency = (counts.fillna(0) / n_subsamples).sort_values(ascending=False, kind='stable')
+    return {'frequency': frequency, 'selected': frequency.index[frequency >= threshold].tolist(),
+            'selections': selections, 'seconds': wall_time}
+
+
+# Pre-pruning of collinear factors before the wrapper methods (RFE, XGBoost importance), which otherwise spend
+# most of their fits separating near-duplicates (variants of value, momentum, size...):
+# - the correlation matrix of the factors (and the target) comes from one pass of X'X over row chunks
+# - complete-linkage clustering on 1 - |corr|, so every two factors of a cluster have |corr| >= `threshold`
+# - one representative per cluster: the factor most correlated with the target, or without a target the one
+#   most correlated with the rest of its cluster
+
+def correlation_matrix(X: pd.DataFrame, chunksize: int = 100_000) -> pd.DataFrame:
+    # Pearson correlation from the sums and cross products of the columns, constant columns have 0 correlation
+    n, sums, cross = 0, np.zeros(X.shape[1]), np.zeros((X.shape[1], X.shape[1]))
+    for start in range(0, len(X), chunksize):
+        chunk = X.iloc[start:start + chunksize].to_numpy(dtype=float)
+        n, sums, cross = n + len(chunk), sums + chunk.sum(axis=0), cross + chunk.T @ chunk
+    mean = sums / n
+    cov = cross / n - np.outer(mean, mean)
+    std = np.sqrt(np.clip(np.diag(cov), 0, None))
+    std[std == 0] = np.inf
+    return pd.DataFrame(cov / np.outer(std, std), index=X.columns, columns=X.columns)
+
+def correlation_clusters(X: pd.DataFrame, y: pd.Series = None, threshold: float = 0.9, chunksize: int = 100_000) -> dict:
+    """Clusters of factors with pairwise |corr| >= `threshold`, and one representative factor per cluster
+
+    Returns the representatives (in the column order of `X`), a table of the clusters that merged several factors
+    (representative, merged factors, size, lowest |corr| in the cluster) and the absolute correlation matrix.
+    """
+    start = time.perf_counter()
+    columns = list(X.columns)
+    corr = correlation_matrix(X.assign(__target__=y) if y is not None else X, chunksize)
+    target = corr.pop('__target__').drop('__target__').abs() if y is not None else None
+    corr = corr.loc[columns, columns].abs()
+
+    distance = np.clip(1 - corr.to_numpy(), 0, None)
+    np.fill_diagonal(distance, 0)
+    labels = fcluster(linkage(squareform(distance, checks=False), method='complete'), t=1 - threshold, criterion='distance')
+
+    representatives, merged = [], []
+    for label in np.unique(labels):
+        members = [column for column, member in zip(columns, labels == label) if member]
+        if target is not None:
+            representative = target[members].idxmax()
+        else:
+            representative = corr.loc[members, members].sum().idxmax()
+        representatives.append(representative)
+        if len(members) > 1:
+            merged.append((representative, [m for m in members if m != representative], len(members),
+                           corr.loc[members, members].to_numpy().min()))
+
+    features = [column for column in columns if column in set(representatives)]
+    clusters = pd.DataFrame(merged, columns=['Representative', 'Merged', 'Size', 'Min |corr|']).sort_values('Size', ascending=False, ignore_index=True)
+    print(f"{len(columns)} factors -> {len(features)} clusters with |corr| >= {threshold} ({time.perf_counter() - start:.1f}s)")
+    return {'features': features, 'clusters': clusters, 'corr': corr}
+
+
+# Mutual information of every factor with the target from 2-d histograms, instead of the k-NN estimator of
+# sklearn's `mutual_info_regression` (too slow beyond a sample of stocks). The cleaned factors are ranks on
+# [-1, 1], so they are binned on fixed edges without sorting; the target is binned on its quantiles. The joint
+# counts of all factors are accumulated over row chunks with a single `bincount` per chunk.
+
+def binned_mutual_info(X: pd.DataFrame, y: pd.Series, bins: int = 32, value_range: tuple = (-1, 1),
+                       sample: int = None, chunksize: int = 50_000, random_state: int = 0) -> pd.Series:
+    """Mutual information (nats) of each column of `X` with `y`, on `bins` x `bins` histograms
+
+    `sample` scores a random subset of that many rows, the counts are built `chunksize` rows at a time.
+    """
+    y = np.asarray(y, dtype=float)
+    rows = np.arange(len(y))
+    if sample is not None and sample < len(y):
+        rows = np.sort(np.random.default_rng(random_state).choice(len(y), sample, replace=False))
+
+    y_edges = np.unique(np.quantile(y[rows], np.linspace(0, 1, bins + 1)[1:-1]))
+    y_bins = len(y_edges) + 1
+    offsets = (np.arange(X.shape[1]) * bins * y_bins)[None, :]
+    low, width = value_range[0], (value_range[1] - value_range[0]) / bins
+
+    counts = np.zeros(X.shape[1] * bins * y_bins, dtype=np.int64)
+    for start in range(0, len(rows), chunksize):
+        chunk = rows[start:start + chunksize]
+        values = np.nan_to_num(X.iloc[chunk].to_numpy(dtype=float))
+        x_codes = np.clip(((values - low) / width).astype(np.int32), 0, bins - 1)
+        y_codes = np.searchsorted(y_edges, y[chunk], side='right').astype(np.int32)
+        counts += np.bincount((offsets + x_codes * y_bins + y_codes[:, None]).ravel(), minlength=len(counts))
+
+    joint = counts.reshape(X.shape[1], bins, y_bins) / len(rows)
+    marginals = joint.sum(axis=2, keepdims=True) * joint.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(joint > 0, joint * np.log(joint / marginals), 0)
+    return pd.Series(terms.sum(axis=(1, 2)), index=X.columns)
+
+
+# Cross-sectional information coefficients: every month, the Spearman correlation of each factor with the excess
+# return `h` months later, over the stocks of that month. `stock_exret` is already the next month's return of the
+# row (the target of every model of `predict_data.py`), so horizon `h` is the target of the same stock `h - 1` rows
+# later and the first horizon is the same-row target. The ranks of all factors of a month are computed in one
+# batched `rankdata`, and their correlations with the target ranks are one matrix product per month and horizon.
+# Rows are expected without missing factors (the output of `cleandata`); stocks without a return `h` months
+# later are left out of that horizon.
+
+def information_coefficients(data: pd.DataFrame, factors: list, target: str = 'stock_exret',
+                             horizons: tuple = (1, 2, 3, 6, 12)) -> dict:
+    """Monthly Spearman IC of every factor with the return `h` months ahead (`target` `h - 1` rows later), for each `h`
+
+    Returns a summary per factor (mean, standard deviation and t-stat of the IC at the first horizon, number of
+    months, mean IC at every horizon as `IC <h>m`) and the monthly IC series of the first horizon (months x factors).
+    """
+    start = time.perf_counter()
+    data = data.sort_values(['year', 'month'])
+    month = (data['year'] * 12 + data['month'] - 1).to_numpy()
+    X = data[factors].to_numpy(dtype=float)
+
+    # Target of the same stock `h - 1` months later (the row's own target for h = 1), NaN when it has no row then
+    returns = pd.Series(data[target].to_numpy(dtype=float), index=pd.MultiIndex.from_arrays([data['permno'].to_numpy(), month]))
+    ahead = np.column_stack([returns.reindex(pd.MultiIndex.from_arrays([data['permno'].to_numpy(), month + h - 1])).to_numpy()
+                             for h in horizons])
+
+    months, starts = np.unique(month, return_index=True)
+    ics = np.full((len(horizons), len(months), len(factors)), np.nan)
+    for i, (begin, end) in enumerate(zip(starts, list(starts[1:]) + [len(month)])):
+        for k in range(len(horizons)):
+            valid = ~np.isnan(ahead[begin:end, k])
+            if valid.sum() < 3:
+                continue
+            ranks = rankdata(X[begin:end][valid], axis=0)
+            ranks -= ranks.mean(axis=0)
+            target_ranks = rankdata(ahead[begin:end, k][valid])
+            target_ranks -= target_ranks.mean()
+            norms = np.sqrt((ranks ** 2).sum(axis=0) * (target_ranks ** 2).sum())
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ics[k, i] = np.where(norms > 0, target_ranks @ ranks / norms, 0)
+
+    monthly = pd.DataFrame(ics[0], index=pd.to_datetime({'year': months // 12, 'month': months % 12 + 1, 'day': 1}),
+                           columns=factors).dropna(how='all')
+    summary = pd.DataFrame({'IC mean': monthly.mean(), 'IC std': monthly.std(), 'Months': monthly.count()})
+    summary['IC t-stat'] = summary['IC mean'] / summary['IC std'] * np.sqrt(summary['Months'])
+    for k, h in enumerate(horizons):
+        summary[f'IC {h}m'] = np.nanmean(ics[k], axis=0)
+    print(f"IC of {len(factors)} factors over {len(monthly)} months, horizons {list(horizons)} ({time.perf_counter() - start:.1f}s)")
+    return {'summary': summary.sort_values('IC t-stat', key=np.abs, ascending=False), 'monthly': monthly}
+
+def check_ic_alignment(n_stocks: int = 200, n_months: int = 60, n_noise: int = 9, seed: int = 0):
+    """Assert that a synthetic factor built to predict the same-row target has the largest |IC t-stat|
+
+    The other factors predict the target of the next row, i.e. the return two months ahead.
+    """
+    rng = np.random.default_rng(seed)
+    permno, month = np.meshgrid(np.arange(n_stocks), np.arange(n_months), indexing='ij')
+    data = pd.DataFrame({'permno': permno.ravel(), 'year': 2000 + month.ravel() // 12, 'month': month.ravel() % 12 + 1,
+                         'stock_exret': rng.standard_normal(permno.size)})
+    data['signal'] = data['stock_exret'] + 2 * rng.standard_normal(len(data))
+    following = data.groupby('permno')['stock_exret'].shift(-1).fillna(0).to_numpy()
+    noise = [f'noise_{i}' for i in range(n_noise)]
+    for name in noise:
+        data[name] = 0.5 * following + rng.standard_normal(len(data))
+    summary = information_coefficients(data, ['signal'] + noise, horizons=(1, 2))['summary']
+    assert summary.index[0] == 'signal', summary
+    assert summary.loc['signal', 'IC 1m'] > summary.loc[noise, 'IC 1m'].abs().max(), summary
+
+
+# Evaluation of candidate feature sets (section 2.5.3) on shared data: the train / test split and the RobustScaler
+# of the union of their features are done once (the scaler works column by column, so the columns of a candidate
+# are scaled exactly as if it was scaled alone), the scaled matrices are memory-mapped into the workers and each
+# candidate trains on its columns. With `early_stopping_rounds`, the last `valid_fraction` of the training rows
+# stops the boosting, the test rows are only used for the scores.
+
+EVAL_PARAMS = {'n_estimators': 500, 'learning_rate': 0.1, 'subsample': 0.8, 'colsample_bytree': 0.8, 'random_state': 42}
+
+def _fit_candidate(name, index, X_train, y_train, X_test, y_test, params, early_stopping_rounds, valid_fraction, threads):
+    from xgboost import XGBRegressor
+    if not index:
+        return name, 0, np.nan, np.inf, 0, 0.0
+    start = time.perf_counter()
+    model = XGBRegressor(**params, tree_method='hist', n_jobs=threads, early_stopping_rounds=early_stopping_rounds)
+    if early_stopping_rounds:
+        n_fit = int(len(y_train) * (1 - valid_fraction))
+        model.fit(X_train[:n_fit, index], y_train[:n_fit], eval_set=[(X_train[n_fit:, index], y_train[n_fit:])], verbose=False)
+        trees = model.best_iteration + 1
+    else:
+        model.fit(X_train[:, index], y_train)
+        trees = params.get('n_estimators', 100)
+    seconds = time.perf_counter() - start
+    y_pred = model.predict(X_test[:, index])
+    return name, len(index), r2_score(y_test, y_pred), mean_squared_error(y_test, y_pred), trees, seconds
+
+def evaluate_feature_sets(X: pd.DataFrame, y: pd.Series, candidates: dict, params: dict = EVAL_PARAMS,
+                          early_stopping_rounds: int = None, valid_fraction: float = 0.1, test_size: float = 0.2,
+                          random_state: int = 42, n_jobs: int = -1) -> pd.DataFrame:
+    """Test R^2 / MSE of an XGBRegressor(**params) on each candidate `{name: features}`, all columns of `X`
+
+    Returns one row per candidate with its number of features, R^2, MSE, trees and fit seconds.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
+    scaler = RobustScaler()
+    X_train, X_test = scaler.fit_transform(X_train), scaler.transform(X_test)
+    y_train, y_test = np.asarray(y_train, dtype=float), np.asarray(y_test, dtype=float)
+
+    columns = list(X.columns)
+    processes, threads = core_budget(len(candidates), n_jobs)
+    start = time.perf_counter()
+    results = Parallel(n_jobs=processes, max_nbytes='1M', mmap_mode='r')(
+        delayed(_fit_candidate)(name, [columns.index(feature) for feature in features], X_train, y_train, X_test, y_test,
+                                params, early_stopping_rounds, valid_fraction, threads)
+        for name, features in candidates.items())
+    print(f"{len(candidates)} feature sets on {processes} processes x {threads} threads: {time.perf_counter() - start:.1f}s")
+    return pd.DataFrame(results, columns=['Method', 'Features', 'R_squared', 'MSE', 'Trees', 'Seconds'])
+
+
+# Recursive feature elimination with XGBoost (section 2.5.2), without sklearn's `RFE` refitting a full model on
+# float data for every `step` features removed:
+# - the factors are quantized once into bin codes (the cleaned factors are ranks, so few distinct values), every
+#   round builds its histogram `QuantileDMatrix` from a column view of the codes and trains with `tree_method='hist'`
+# - `step_fraction` removes that share of the features still above the target, at least `step`: large steps
+#   early on, `step` near the target
+# - every round (features and their importances) is checkpointed to a JSON file: an interrupted run resumes from
+#   it, and `rfe_features` reads the set of any size from it without refitting
+
+RFE_PARAMS = {'learning_rate': 0.1, 'subsample': 0.8, 'colsample_bytree': 0.8, 'seed': 42}
+
+def quantize(X: np.ndarray, max_bin: int = 256) -> np.ndarray:
+    # Bin code of every value, per column: its distinct values when there are at most `max_bin`, quantile bins otherwise
+    codes = np.empty(X.shape, dtype=np.uint8 if max_bin <= 256 else np.uint16)
+    for j in range(X.shape[1]):
+        column = X[:, j]
+        edges = np.unique(column)
+        if len(edges) > max_bin:
+            edges = np.unique(np.quantile(column, np.linspace(0, 1, max_bin + 1)[1:-1]))
+            codes[:, j] = np.searchsorted(edges, column, side='right')
+        else:
+            codes[:, j] = np.searchsorted(edges, column)
+    return codes
+
+def _read_rounds(checkpoint_file):
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            return json.load(f)
+    return None
+
+def _write_rounds(checkpoint_file, checkpoint):
+    with open(checkpoint_file + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+def rfe_features(checkpoint, n_features: int) -> list:
+    """The `n_features` kept by the elimination recorded in `checkpoint` (a file or its content), without refitting
+
+    Uses the importances of the smallest recorded round with at least `n_features` features, which is the set RFE
+    ends with when that round's step stops at `n_features`.
+    """
+    checkpoint = _read_rounds(checkpoint) if isinstance(checkpoint, str) else checkpoint
+    candidates = [round_ for round_ in checkpoint['rounds'] if len(round_['features']) >= n_features]
+    if not candidates:
+        raise ValueError(f"The elimination has no round with {n_features} features or more.")
+    round_ = candidates[-1]
+    order = np.argsort(round_['importances'], kind='stable')[::-1][:n_features]
+    return [round_['features'][i] for i in sorted(order)]
+
+def fast_rfe(X: pd.DataFrame, y, n_features_to_select: int = 50, step: int = 5, step_fraction: float = 0,
+             num_boost_round: int = 500, params: dict = RFE_PARAMS, max_bin: int = 256, checkpoint_file: str = None,
+             n_jobs: int = -1) -> list:
+    """XGBoost recursive feature elimination down to `n_features_to_select`, returns the selected feature names"""
+    import xgboost as xgb
+
+    columns = list(X.columns)
+    train_params = {**params, 'tree_method': 'hist', 'max_bin': max_bin, 'nthread': n_jobs, 'objective': 'reg:squarederror'}
+    settings = {'columns': columns, 'n_rows': len(X), 'n_features_to_select': n_features_to_select, 'step': step, 'step_fraction': step_fraction,
+                'num_boost_round': num_boost_round, 'params': {k: v for k, v in train_params.items() if k != 'nthread'}}
+
+    # Resume the rounds of an interrupted run with the same data and settings
+    checkpoint = _read_rounds(checkpoint_file)
+    if checkpoint is None or checkpoint['settings'] != settings:
+        checkpoint = {'settings': settings, 'rounds': []}
+
+    codes = quantize(np.asarray(X, dtype=float), max_bin)
+    y = np.asarray(y, dtype=float)
+    features = checkpoint['rounds'][-1]['remaining'] if checkpoint['rounds'] else columns
+
+    while len(features) > n_features_to_select:
+        start = time.perf_counter()
+        index = [columns.index(feature) for feature in features]
+        dtrain = xgb.QuantileDMatrix(codes[:, index], label=y, max_bin=max_bin, feature_names=features)
+        booster = xgb.train(train_params, dtrain, num_boost_round=num_boost_round)
+
+        # Average gain per split, the `feature_importances_` of XGBRegressor used by sklearn's RFE, 0 for features never split on
+        scores = booster.get_score(importance_type='gain')
+        importances = np.array([scores.get(feature, 0.0) for feature in features])
+        importances = importances / importances.sum() if importances.sum() > 0 else importances
+
+        excess = len(features) - n_features_to_select
+        n_remove = min(excess, max(step, int(np.ceil(step_fraction * excess))))
+        removed = set(np.array(features)[np.argsort(importances, kind='stable')[:n_remove]])
+        remaining = [feature for feature in features if feature not in removed]
+
+        checkpoint['rounds'].append({'features': features, 'importances': importances.tolist(), 'remaining': remaining,
+                                     'seconds': time.perf_counter() - start})
+        if checkpoint_file:
+            _write_rounds(checkpoint_file, checkpoint)
+        print(f"[RFE] {len(features)} -> {len(remaining)} features | {time.perf_counter() - start:.1f}s")
+        features = remaining
+
+    return features
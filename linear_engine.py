@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from functools import reduce
+from operator import add
+from sklearn.linear_model import ElasticNet, enet_path
+
+# OLS / ridge / lasso / elastic net of `predict_data.train_and_predict`, solved from sufficient statistics.
+#
+# For an expanding window X'X, X'y, y'y and the column sums are running sums over yearly blocks, so each year of
+# the panel is reduced once to its statistics and every window costs O(p^2) (plus O(p^3) solves) instead of O(n p)
+# over the whole history. The window's RobustScaler (center / scale) and the target demeaning are affine maps,
+# applied to the statistics instead of the rows. Cross-validation folds are groups of contiguous years: the training
+# statistics of a fold are the window total minus the fold's blocks. This is a change of CV folds, not a replica of
+# the sklearn path: sklearn's `cv=5` KFold cuts the rows anywhere, so the chosen ridge / lasso / elastic net alphas,
+# and the predictions, differ from `--linear=sklearn`.
+#
+# Lasso / elastic net use sklearn's coordinate descent on a (p+1) x p "square root" R of the centered Gram
+# matrix (R'R = [X y]'[X y]), which has the same least-squares objective as the full data up to a constant.
+
+class BlockStats:
+    """Sufficient statistics `n, sum x, sum y, X'X, X'y, y'y` of a block of rows"""
+
+    def __init__(self, n, sx, sy, XtX, Xty, yty):
+        self.n, self.sx, self.sy, self.XtX, self.Xty, self.yty = n, sx, sy, XtX, Xty, yty
+
+    @classmethod
+    def from_arrays(cls, X, y):
+        return cls(len(y), X.sum(axis=0), y.sum(), X.T @ X, X.T @ y, y @ y)
+
+    def __add__(self, other):
+        return BlockStats(self.n + other.n, self.sx + other.sx, self.sy + other.sy,
+                          self.XtX + other.XtX, self.Xty + other.Xty, self.yty + other.yty)
+
+    def __sub__(self, other):
+        return BlockStats(self.n - other.n, self.sx - other.sx, self.sy - other.sy,
+                          self.XtX - other.XtX, self.Xty - other.Xty, self.yty - other.yty)
+
+    def transform(self, center, scale, y_shift):
+        # Statistics of `(x - center) / scale` and `y - y_shift`
+        n, sx, sy = self.n, self.sx - self.n * center, self.sy - self.n * y_shift
+        XtX = self.XtX - np.outer(center, self.sx) - np.outer(self.sx, center) + n * np.outer(center, center)
+        Xty = self.Xty - center * self.sy - self.sx * y_shift + n * center * y_shift
+        yty = self.yty - 2 * y_shift * self.sy + n * y_shift ** 2
+        return BlockStats(n, sx / scale, sy, XtX / np.outer(scale, scale), Xty / scale, yty)
+
+    def centered(self):
+        # Means and the Gram matrices of the centered block, what a model with an intercept is fitted on
+        x_mean, y_mean = self.sx / self.n, self.sy / self.n
+        G = self.XtX - self.n * np.outer(x_mean, x_mean)
+        g = self.Xty - self.n * x_mean * y_mean
+        return x_mean, y_mean, G, g, self.yty - self.n * y_mean ** 2
+
+    def sse(self, coef, intercept):
+        # Sum of squared errors of `intercept + X @ coef` for every column of `coef` (one per alpha)
+        return (self.yty - 2 * intercept * self.sy - 2 * coef.T @ self.Xty + self.n * intercept ** 2
+                + 2 * intercept * (coef.T @ self.sx) + np.einsum('ik,ij,jk->k', coef, self.XtX, coef))
+
+
+class LinearFit:
+    """Coefficients and intercept fitted from statistics, with the `predict` of a fitted sklearn model"""
+
+    def __init__(self, coef, intercept):
+        self.coef_, self.intercept_ = coef, intercept
+
+    def predict(self, X):
+        return X @ self.coef_ + self.intercept_
+
+
+def square_root(G, g, syy):
+    # (p+1) x p design and (p+1) target with the same Gram matrices as the centered data
+    A = np.block([[G, g[:, None]], [g[None, :], np.array([[syy]])]])
+    eigenvalues, eigenvectors = np.linalg.eigh(A)
+    R = np.sqrt(np.clip(eigenvalues, 0, None))[:, None] * eigenvectors.T
+    return np.asfortranarray(R[:, :-1]), R[:, -1].copy()
+
+
+class GramLinearModels:
+    """Per-year statistics of a panel and the linear models of every window fitted from them"""
+
+    def __init__(self, n_folds=5, ridge_alphas=(0.1, 1.0, 10.0), n_alphas=100, eps=1e-3, l1_ratios={'lasso': 1.0, 'en': 0.5}):
+        self.n_folds = n_folds
+        self.ridge_alphas = np.array(ridge_alphas)
+        self.n_alphas = n_alphas
+        self.eps = eps
+        self.l1_ratios = l1_ratios
+        self.blocks = {}
+        self.fitted = {}
+        self.models = {name: ElasticNet(l1_ratio=l1_ratio, fit_intercept=False, warm_start=True) for name, l1_ratio in l1_ratios.items()}
+
+    def block(self, panel, year):
+        # Raw statistics of one year, computed once and reused by every later window
+        if year not in self.blocks:
+            rows = panel.window(pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year + 1, month=1, day=1))
+            self.blocks[year] = BlockStats.from_arrays(panel.X[rows], panel.y[rows])
+        return self.blocks[year]
+
+    def alpha_path(self, name, g_total, n):
+        # sklearn's alpha grid of LassoCV / ElasticNetCV, from the window's own alpha_max so it only depends on the window
+        alpha_max = np.abs(g_total).max() / (n * self.l1_ratios[name])
+        return np.logspace(np.log10(alpha_max * self.eps), np.log10(alpha_max), self.n_alphas)[::-1]
+
+    def fit_predict(self, panel, cutoff, center, scale, y_mean, X_test) -> dict:
+        years = list(range(cutoff[0].year, cutoff[1].year))
+        p = len(center)
+        blocks = [self.block(panel, year).transform(center, scale, y_mean) for year in years]
+        total = reduce(add, blocks)
+        folds = [reduce(add, [blocks[i] for i in part]) for part in np.array_split(np.arange(len(blocks)), min(self.n_folds, len(blocks)))]
+
+        x_mean, y_bar, G, g, syy = total.centered()
+        coefs = {}
+
+        # OLS: minimum-norm solution of the normal equations (same as a least-squares solver on the rows)
+        coefs['ols'] = np.linalg.lstsq(G, g, rcond=None)[0]
+
+        # Ridge: alpha picked by the mean R^2 over the folds, like RidgeCV(cv=5)
+        fold_r2 = np.zeros(len(self.ridge_alphas))
+        for fold in folds:
+            fx_mean, fy_mean, fG, fg, _ = (total - fold).centered()
+            coef = np.column_stack([np.linalg.solve(fG + alpha * np.eye(p), fg) for alpha in self.ridge_alphas])
+            sst = fold.yty - fold.sy ** 2 / fold.n
+            fold_r2 += 1 - fold.sse(coef, fy_mean - fx_mean @ coef) / sst
+        best_alpha = self.ridge_alphas[np.argmax(fold_r2)]
+        coefs['ridge'] = np.linalg.solve(G + best_alpha * np.eye(p), g)
+
+        # Lasso / elastic net: coordinate-descent path on each fold, alpha with the lowest mean validation MSE
+        for name, l1_ratio in self.l1_ratios.items():
+            alphas = self.alpha_path(name, g, total.n)
+            fold_mse = np.zeros(len(alphas))
+            for fold in folds:
+                fx_mean, fy_mean, fG, fg, fsyy = (total - fold).centered()
+                X_root, y_root = square_root(fG, fg, fsyy)
+                # sklearn's objective is scaled by 1 / n_samples, rescale alpha from the fold's rows to the (p+1) root rows
+                _, coef, _ = enet_path(X_root, y_root, l1_ratio=l1_ratio, alphas=alphas * (total.n - fold.n) / len(y_root))
+                fold_mse += fold.sse(coef, fy_mean - fx_mean @ coef) / fold.n
+            # The previous window's coefficients are only the starting point of the coordinate descent (`warm_start`)
+            X_root, y_root = square_root(G, g, syy)
+            model = self.models[name]
+            model.set_params(alpha=alphas[np.argmin(fold_mse)] * total.n / len(y_root))
+            coefs[name] = model.fit(X_root, y_root).coef_.copy()
+
+        # Intercept of the centered fit, predictions on the already scaled test features.
+        # The models of the last window are kept, e.g. to score later months with them
+        self.fitted = {name: LinearFit(coefs[name], y_bar - x_mean @ coefs[name]) for name in ['ols', 'lasso', 'ridge', 'en']}
+        return {name: model.predict(X_test) for name, model in self.fitted.items()}
@@ -35,7 +35,7 @@ print(f"Current Environment location: `{os.path.basename(sys.prefix)}`", end='\n
 # ## 1 - Import Packages
 # 
 # Run the cell below to import all the necessary packages: <br>
-# `pip install -r requirements.txt` or `pip install pandas scikit-learn statsmodels xgboost matplotlib requests`
+# `pip install -r requirements.txt` or `pip install pandas scikit-learn statsmodels xgboost matplotlib requests pyarrow`
 
 # In[ ]:
 
@@ -45,7 +45,7 @@ print(f"Current Environment location: `{os.path.basename(sys.prefix)}`", end='\n
 
 # ---OR---
 
-# %pip install pandas scikit-learn statsmodels xgboost matplotlib requests
+# %pip install pandas scikit-learn statsmodels xgboost matplotlib requests pyarrow
 
 
 # In[3]:
@@ -59,7 +59,7 @@ plt.interactive(True)
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.linear_model import LassoCV, ElasticNetCV
-from sklearn.feature_selection import mutual_info_regression, RFE
+from sklearn.feature_selection import RFE
 from sklearn.preprocessing import StandardScaler, RobustScaler
 from xgboost import XGBRegressor
 
@@ -89,29 +89,33 @@ os.makedirs(ASSET_FOLDER, exist_ok=True)
 
 CLEAN_DATA_FOLDER = "clean_data"
 CLEAN_FACTOR_PATH = os.path.join(CLEAN_DATA_FOLDER, 'factor.csv')
-CLEAN_DATA_PATH = os.path.join(CLEAN_DATA_FOLDER, 'data.csv')
+CLEAN_DATA_PATH = os.path.join(CLEAN_DATA_FOLDER, 'data.parquet') # Columnar format keeps dtypes/dates and is much faster to read than CSV
 os.makedirs(CLEAN_DATA_FOLDER, exist_ok=True)
 
+# Cleaning scheme of the panel, recorded next to every saved data file: point in time (each month's stocks ranked
+# against each other, missing values filled with the stock's median up to that month), the only scheme
+# `append_month.py` can continue. {'rank_by': 'permno', 'impute': 'median'} is the full-history scheme
+CLEANING = {'rank_by': 'date', 'impute': 'expanding'}
+
 PREDICTED_FOLDER = "predictions"
 OUTPUT_PREDICTS_PATH = os.path.join(PREDICTED_FOLDER, 'output.csv')
 os.makedirs(PREDICTED_FOLDER, exist_ok=True)
 
-def save_file(df, file_name='file.csv', with_index=False):
-    df.to_csv(file_name, index=with_index)
-    print(f"Saved `{file_name}`.")
-
-def read_file(file_name='file.csv', parse_dates=[]):
-    print(f"Read `{file_name}`.")
-    return pd.read_csv(file_name, parse_dates=parse_dates)
+# `save_file`/`read_file` pick the storage format (.csv, .parquet, .feather) from the file extension
+from storage import save_file, read_file
+from cleaning import save_cleaning_scheme
 
-def inputData(factor_file=CLEAN_FACTOR_PATH, data_file=CLEAN_DATA_PATH):
+def inputData(factor_file=CLEAN_FACTOR_PATH, data_file=CLEAN_DATA_PATH, key_vars=None):
     factor = list(read_file(factor_file)["variable"].values)
-    data = read_file(data_file, parse_dates=['date'])
+    # Only read the factors and `key_vars` when given, otherwise read every column
+    columns = key_vars + factor if key_vars is not None else None
+    data = read_file(data_file, parse_dates=['date'], columns=columns)
     return factor, data
 
-def outputData(factor, data, factor_file=CLEAN_FACTOR_PATH, data_file=CLEAN_DATA_PATH):
+def outputData(factor, data, factor_file=CLEAN_FACTOR_PATH, data_file=CLEAN_DATA_PATH, cleaning=CLEANING):
     save_file(pd.DataFrame({'variable': factor}), factor_file)
     save_file(data, data_file)
+    save_cleaning_scheme(data_file, **cleaning)
 
 def download_file(url, save_path, extract=False):
     """Download a file and optionally extract if it's compressed"""
@@ -180,7 +184,7 @@ response = download_file(
 # In[6]:
 
 
-stock_vars, raw = inputData(factor_file=ASSET_FACTOR_PATH, data_file=ASSET_DATA_PATH)
+stock_vars, raw = inputData(factor_file=ASSET_FACTOR_PATH, data_file=ASSET_DATA_PATH, key_vars=['year', 'month', 'date', 'permno', 'comp_name', 'stock_exret'])
 
 
 # In[7]:
@@ -325,13 +329,21 @@ plt.show()
 # In[14]:
 
 
+from cleaning import cleandata_vectorized, cleandata_out_of_core, CleanStats, check_parity
+
 def cleandata(input_factor: list,
               raw: pd.DataFrame,
               missing_values_percent_threshold=0.30, # Keep factors that have lower missing values percentage than this
               zero_values_percent_threshold=0.20, # Keep factors that have lower zero values percentage than this
-              months_threshold=100 # Keep stocks that have higher number of months data than this
+              months_threshold=100, # Keep stocks that have higher number of months data than this
+              engine='pandas', # 'vectorized': same steps as array segment reductions (`cleaning.py`), much faster on the full panel
+              rank_by='permno', # Rank each stock through time ('permno') or the stocks of each month against each other ('date')
+              impute='median' # Fill with the stock's full-history median ('median') or, point in time, its median up to each month ('expanding')
               ) -> pd.DataFrame:
 
+  if engine == 'vectorized':
+    return cleandata_vectorized(input_factor, raw, missing_values_percent_threshold, zero_values_percent_threshold, months_threshold, rank_by, impute)
+
   clean_data = raw[input_factor]
   total_entries = len(clean_data)
   left_hand_side_vars = ['year', 'month', 'date', 'permno', 'comp_name', 'stock_exret'] # those are not part of the factors, but should be kept
@@ -367,7 +379,11 @@ def cleandata(input_factor: list,
 
   # FILLING MISSING VALUES
   # Calculate the median for each factor and fill missing values
-  medians = clean_data.groupby('permno')[clean_factor].transform('median')
+  if impute == 'expanding':
+    # Median of the stock's values up to each month, no look-ahead
+    medians = clean_data.sort_values('date').groupby('permno')[clean_factor].expanding().median().reset_index(level=0, drop=True)
+  else:
+    medians = clean_data.groupby('permno')[clean_factor].transform('median')
 
   # Fill missing values with the corresponding median
   clean_data[clean_factor] = clean_data[clean_factor].fillna(medians)
@@ -378,13 +394,14 @@ def cleandata(input_factor: list,
 
 
   # RANKING AND NORMALIZATION
-  # Rank all selected factors for each stock (permno)
-  clean_data[clean_factor] = clean_data.groupby('permno')[clean_factor].rank(method="dense") - 1
-  max_ranks = clean_data.groupby('permno')[clean_factor].transform('max')
+  # Rank all selected factors for each stock (permno), or for each month (date)
+  clean_data[clean_factor] = clean_data.groupby(rank_by)[clean_factor].rank(method="dense") - 1
+  max_ranks = clean_data.groupby(rank_by)[clean_factor].transform('max')
 
   # Normalize the ranked values to the range [-1, 1]
   normalized_data = (clean_data[clean_factor] / max_ranks) * 2 - 1
   normalized_data[max_ranks == 0] = 0   # Avoid division by zero by checking where max_ranks == 0 and setting those values to 0
+  normalized_data = normalized_data.fillna(0) # Values still missing before the stock's first observation (expanding median)
   clean_data[clean_factor] = normalized_data
 
 
@@ -394,9 +411,12 @@ def cleandata(input_factor: list,
 # In[15]:
 
 
-factor, data = cleandata(stock_vars, raw)
+factor, data = cleandata(stock_vars, raw, engine='vectorized', **CLEANING)
 data.info()
 
+# Parity of the vectorized engine with the pandas implementation (slow)
+# check_parity(cleandata(stock_vars, raw)[1], data)
+
 
 # In[16]:
 
@@ -404,13 +424,23 @@ data.info()
 # Save
 outputData(factor, data)
 
+# Raw panels larger than memory: two passes over the raw file, the cleaned panel is written straight to `CLEAN_DATA_PATH`
+# (partitions by stock, so only the per-stock ranking of the full-history scheme, not usable with `append_month.py`)
+# factor = cleandata_out_of_core(stock_vars, ASSET_DATA_PATH, CLEAN_DATA_PATH)
+# save_file(pd.DataFrame({'variable': factor}), CLEAN_FACTOR_PATH)
+
 
 # #### Cleaned data subset that contains stocks have full 288 months
 
 # In[17]:
 
 
-# factors_288_months, data_288_months = cleandata(stock_vars, raw, months_threshold=288)
+# Threshold sweep: the factor/stock counts are computed once, then every combination is evaluated from them
+# clean_stats = CleanStats(stock_vars, raw)
+# clean_stats.sweep(missing_values_percent_thresholds=[0.2, 0.3, 0.4], zero_values_percent_thresholds=[0.1, 0.2, 0.3], months_thresholds=[100, 200, 288])
+# factors_288_months, data_288_months = clean_stats.materialize(raw, months_threshold=288, **CLEANING)
+
+# factors_288_months, data_288_months = cleandata(stock_vars, raw, months_threshold=288, engine='vectorized', **CLEANING)
 # data_288_months.info()
 # outputData(factors_288_months, data_288_months, data_file=os.path.join(CLEAN_DATA_FOLDER, 'data_288_months.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'factor_288_months.csv'))
 
@@ -494,16 +524,19 @@ def load_and_extract_data(data: pd.DataFrame,
 # In[19]:
 
 
+from functools import partial
+from feature_selection import run_selectors, correlation_clusters, binned_mutual_info, information_coefficients, check_ic_alignment, stability_selection, evaluate_feature_sets
+
 # 1. Filter Method: Pearson Correlation Analysis
 def correlation_selection(X, y, k=10):
-  cor = pd.DataFrame(X.corrwith(y)).abs()
-  selected_features = cor[:k].index.tolist()
+  cor = X.corrwith(y).abs()
+  selected_features = cor.nlargest(k).index.tolist()
   return X[selected_features]
 
 # 2. Filter Method: Mutual Information
-def mutual_info_selection(X, y, k=10):
-  mi = mutual_info_regression(X, y)
-  mi_series = pd.Series(mi, index=X.columns).sort_values(ascending=False)
+# Binned estimator on the [-1, 1] ranks, `mi` takes scores computed beforehand (e.g. on the full universe)
+def mutual_info_selection(X, y, k=10, mi=None):
+  mi_series = (binned_mutual_info(X, y) if mi is None else mi[X.columns]).sort_values(ascending=False)
   selected_features = mi_series.nlargest(k).index.tolist()
   return X[selected_features]
 
@@ -557,75 +590,58 @@ def rf_importance_selection(X, y, k=10):
 
 
 
-# Evaluation function
-def evaluate_model(X, y):
-  X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-  # Train a simple XGBoost model
-  model = XGBRegressor(random_state=42)
-  model.fit(X_train, y_train)
-
-  y_pred = model.predict(X_test)
-  mse = mean_squared_error(y_test, y_pred)
-  return mse
-
-
 # #### Implement
 
 # In[20]:
 
 
-sample_factor, sample_data = load_and_extract_data(data, selected_factors=factor, rand_stocks=(50, 50))
+# First pass on all the stocks: monthly Spearman IC of every factor with the next months' excess returns,
+# the selectors below only see the 100 factors with the largest |IC t-stat| (`ic['summary']` has the IC decay).
+# `IC 1m` is the row's own `stock_exret` (already the next month's return), the target of the models
+check_ic_alignment()
+ic = information_coefficients(data, factor)
+screened_factor = ic['summary'].index[:100].tolist()
+
+sample_factor, sample_data = load_and_extract_data(data, selected_factors=screened_factor, rand_stocks=(50, 50))
 # factors_288_months, data_288_months = inputData(data_file=os.path.join(CLEAN_DATA_FOLDER 'data_288_months.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'factor_288_months.csv'))
 # sample_factor, sample_data = load_and_extract_data(factors_288_months, data_288_months, rand_stocks=(50, 50))
 
 X, y = sample_data[sample_factor], sample_data['stock_exret']
 X.info()
 
-
-# In[21]:
+# Mutual information of every factor on all the stocks, not only the sample (`sample=` rows to subsample)
+mi_full = binned_mutual_info(data[factor], data['stock_exret'])
 
 
-# Record the start time for the entire process
-start_time = datetime.datetime.now()
-
-# Function to time each feature selection method
-def time_feature_selection(method_name, method, *args):
-    start = datetime.datetime.now()
-    result = method(*args)
-    end = datetime.datetime.now()
-    duration = end - start
+# In[21]:
 
-    # Convert duration to seconds
-    total_seconds = duration.total_seconds()
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
 
-    # Format minutes and seconds as MM:SS
-    formatted_time = f"{minutes:02}:{seconds:02}"
-    print(f"{method_name} completed in: {formatted_time}")
-    return result
+# Keep one factor per cluster of factors with |corr| >= 0.9 (the one most correlated with the target), the merged
+# factors are listed in `pruned['clusters']`. Only the wrapper and embedded methods run on the pruned factors, the
+# filter methods (correlation, mutual information) score every factor at almost no cost. Set `wrappers = []` to
+# compare with the selection on every factor
+pruned = correlation_clusters(X, y, threshold=0.9)
+wrappers = ['RFE', 'Lasso', 'Elastic Net', 'XGBoost Feature Importance']
 
-# Apply feature selection methods with timing
-X_corr = time_feature_selection("Correlation selection", correlation_selection, X, y)
-X_mi = time_feature_selection("Mutual information selection", mutual_info_selection, X, y)
-X_rfe = time_feature_selection("RFE selection", rfe_selection, X, y)
-X_lasso = time_feature_selection("Lasso selection", lasso_selection, X, y)
-X_enet = time_feature_selection("Elastic Net selection", elastic_net_selection, X, y)
-X_rf = time_feature_selection("XGBoost feature importance selection", rf_importance_selection, X, y)
+# Run all the methods at the same time on the same data, the cores are split between them
+ensemble = run_selectors({
+    'Correlation': correlation_selection,
+    'Mutual Information': partial(mutual_info_selection, mi=mi_full),
+    'RFE': rfe_selection,
+    'Lasso': lasso_selection,
+    'Elastic Net': elastic_net_selection,
+    'XGBoost Feature Importance': rf_importance_selection,
+}, X, y, columns={name: pruned['features'] for name in wrappers})
 
-# Record the end time for the entire process
-end_time = datetime.datetime.now()
-total_duration = end_time - start_time
+X_corr, X_mi, X_rfe, X_lasso, X_enet, X_rf = [X[features] for features in ensemble['features'].values()]
 
-# Convert total duration to minutes and seconds
-total_seconds = total_duration.total_seconds()
-total_minutes = int(total_seconds // 60)
-total_seconds = int(total_seconds % 60)
+# Homogeneous ensemble: one method on 100 draws of 50 stocks (`block='time'` for blocks of 12 months) instead of
+# a single draw, factors ranked by how often they are selected
+# stability = stability_selection(lasso_selection, data, pruned['features'], n_subsamples=100, block='stock', n_stocks=50)
+# stability['frequency'].head(20)
 
-# Format total running time as MM:SS
-total_formatted_time = f"{total_minutes:02}:{total_seconds:02}"
-print(f"Total running time for all methods: {total_formatted_time}")
+# Running time of each method, the total is close to the slowest one instead of the sum
+ensemble['timing']
 
 
 # In[22]:
@@ -641,16 +657,10 @@ feature_selection_methods = {
     'XGBoost Feature Importance': X_rf,
 }
 
-results = []
-
-# Evaluate each method
-for method_name, X_selected in feature_selection_methods.items():
-    if X_selected.shape[1] > 0:
-        results.append([method_name, evaluate_model(X_selected, y)])
-    else:
-        results.append([method_name, float('inf')])
-
-results = pd.DataFrame(results, columns=['Methods', 'MSE'])
+# Evaluate each method with a default XGBoost (100 trees): one split / scaling of X shared by all the methods,
+# trained at the same time (an empty selection gets an infinite MSE)
+results = evaluate_feature_sets(X, y, {name: list(X_selected.columns) for name, X_selected in feature_selection_methods.items()},
+                                params={'random_state': 42}).rename(columns={'Method': 'Methods'})
 
 # Plotting results
 results.plot(
@@ -685,7 +695,7 @@ print(f'Total Selected Features: {len(all_selected_features)} {all_selected_feat
 
 
 selected_factor_heterogeneous, selected_data_heterogeneous = load_and_extract_data(data, selected_factors=all_selected_features.tolist())
-# outputData(selected_factor, selected_data, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
+# outputData(selected_factor, selected_data, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.parquet'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
 
 
 # <a name="2.5.2"></a>
@@ -721,23 +731,21 @@ X_test_scaled_data = pd.DataFrame(X_test_scaled, columns=X_test.columns, index=X
 # Feature selection using RFE
 n_features_to_select = 50  # Specify the number of features to select
 
-# Initialize the estimator for RFE with correct XGBoost parameters
-estimator = XGBRegressor(
-    n_estimators=500,
-    max_depth=None,    # Consider setting a specific depth if needed for control
-    learning_rate=0.1,  # XGBoost uses learning_rate (analogous to shrinkage)
-    subsample=0.8,      # Control the fraction of samples used
-    colsample_bytree=0.8,  # Control the fraction of features used
-    random_state=42,
-    n_jobs=-1
-)
-
-# Initialize RFE with step parameter for faster elimination
-selector = RFE(estimator=estimator, n_features_to_select=n_features_to_select, step=5)
-selector = selector.fit(X_train_scaled_data, y_train)
-
-# Get selected feature names
-selected_factor_RFE = X_train_scaled_data.columns[selector.support_].tolist()
+# Same XGBoost (500 trees, learning_rate=0.1, subsample=0.8, colsample_bytree=0.8, random_state=42) trained with
+# histograms on the factors quantized once; step_fraction=0.5 removes half of the features above the target
+# per round (at least `step`), and every round is checkpointed, so a rerun resumes / reads the selection from it
+from feature_selection import fast_rfe, rfe_features
+rfe_checkpoint = os.path.join(CLEAN_DATA_FOLDER, 'rfe_rounds.json')
+# Near-duplicate factors (|corr| >= 0.9) are merged first, pass `X_train_scaled_data` to eliminate from every factor
+rfe_pruned = correlation_clusters(X_train_scaled_data, y_train, threshold=0.9)
+selected_factor_RFE = fast_rfe(X_train_scaled_data[rfe_pruned['features']], y_train, n_features_to_select=n_features_to_select, step=5,
+                               step_fraction=0.5, num_boost_round=500, checkpoint_file=rfe_checkpoint)
+# selected_factor_RFE = rfe_features(rfe_checkpoint, n_features_to_select)  # without refitting
+
+# sklearn's RFE (one float XGBRegressor fit per 5 features removed):
+# estimator = XGBRegressor(n_estimators=500, max_depth=None, learning_rate=0.1, subsample=0.8, colsample_bytree=0.8, random_state=42, n_jobs=-1)
+# selector = RFE(estimator=estimator, n_features_to_select=n_features_to_select, step=5).fit(X_train_scaled_data, y_train)
+# selected_factor_RFE = X_train_scaled_data.columns[selector.support_].tolist()
 print(f"Top {n_features_to_select} features selected using RFE:")
 print(selected_factor_RFE)
 
@@ -746,7 +754,7 @@ print(selected_factor_RFE)
 
 
 selected_factor_RFE, selected_data_RFE = load_and_extract_data(data, selected_factors=selected_factor_RFE)
-# outputData(selected_factor, selected_data, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
+# outputData(selected_factor, selected_data, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.parquet'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
 
 
 # <a name="2.5.3"></a>
@@ -755,50 +763,16 @@ selected_factor_RFE, selected_data_RFE = load_and_extract_data(data, selected_fa
 # In[28]:
 
 
-# Function to calculate R-squared for a given dataset
-def calculate_r_squared(selected_data):
-    # Features and target variable selection
-    X = selected_data.drop(columns=['stock_exret', 'date', 'permno', 'year', 'month'])
-    y = selected_data['stock_exret']
-
-    # Train-test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    # Scale the features using RobustScaler
-    scaler = RobustScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-
-    # Initialize the estimator for RFE with correct XGBoost parameters
-    estimator = XGBRegressor(
-        n_estimators=500,
-        max_depth=None,    # Consider setting a specific depth if needed for control
-        learning_rate=0.1,  # XGBoost uses learning_rate (analogous to shrinkage)
-        subsample=0.8,      # Control the fraction of samples used
-        colsample_bytree=0.8,  # Control the fraction of features used
-        random_state=42,
-        n_jobs=-1
-    )
-
-    # Fit the XGBoost model on the selected features
-    estimator.fit(X_train_scaled, y_train)
-
-    # Make predictions on the test set
-    y_pred = estimator.predict(X_test_scaled)
-
-    # Calculate and return the R-squared score
-    r_squared = r2_score(y_test, y_pred)
-    return r_squared
+# Same XGBoost (500 trees) on the two selections: the rows are split and the union of their factors is scaled once,
+# both are trained at the same time (with `early_stopping_rounds=50`, boosting stops on the last 10% of the training rows)
+evaluation = evaluate_feature_sets(data[list(dict.fromkeys(selected_factor_heterogeneous + selected_factor_RFE))], data['stock_exret'],
+                                   {'Heterogeneous': selected_factor_heterogeneous, 'RFE': selected_factor_RFE},
+                                   early_stopping_rounds=50)
+print(evaluation)
 
-# Assuming selected_factor_RFE and selected_data_RFE are your DataFrames
-r_squared_heterogeneous = calculate_r_squared(selected_data_heterogeneous)
-r_squared_RFE = calculate_r_squared(selected_data_RFE)
+# R-squared of each method
+results_df = evaluation[['Method', 'R_squared']]
 
-# Create a DataFrame to store the results
-results_df = pd.DataFrame({
-    'Method': ['Heterogeneous', 'RFE'],
-    'R_squared': [r_squared_heterogeneous, r_squared_RFE]
-})
 # Determine the best method based on R-squared
 best_method = results_df.loc[results_df['R_squared'].idxmax()]
 
@@ -814,9 +788,9 @@ best_method = results_df.loc[results_df['R_squared'].idxmax()]
 
 # Save the best to a file
 if best_method['Method'] == 'selected_factor_RFE':
-    outputData(selected_factor_RFE, selected_data_RFE, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
+    outputData(selected_factor_RFE, selected_data_RFE, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.parquet'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
 else:
-    outputData(selected_factor_heterogeneous, selected_data_heterogeneous, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
+    outputData(selected_factor_heterogeneous, selected_data_heterogeneous, data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.parquet'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
 
 
 # #### Read Extracted Data and Factors
@@ -824,7 +798,7 @@ else:
 # In[30]:
 
 
-selected_factor, selected_data = inputData(data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.csv'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
+selected_factor, selected_data = inputData(data_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_data.parquet'), factor_file=os.path.join(CLEAN_DATA_FOLDER, 'selected_factor.csv'))
 
 
 # <a name="2.6"></a>
@@ -842,7 +816,8 @@ selected_factor, selected_data = inputData(data_file=os.path.join(CLEAN_DATA_FOL
 # In[32]:
 
 
-get_ipython().run_line_magic('run', 'predict_data.py --data=selected_data.csv --factor=selected_factor.csv --work_dir={CLEAN_DATA_FOLDER} --output_dir={PREDICTED_FOLDER}')
+# `--save_models=models` keeps the models of every window to score later months with `append_month.py`
+get_ipython().run_line_magic('run', 'predict_data.py --data=selected_data.parquet --factor=selected_factor.csv --work_dir={CLEAN_DATA_FOLDER} --output_dir={PREDICTED_FOLDER}')
 
 
 # In[33]:
@@ -850,7 +825,7 @@ get_ipython().run_line_magic('run', 'predict_data.py --data=selected_data.csv --
 
 # Old Models
 
-# %run penalized_linear_hackathon.py --data=selected_data.csv --factor=selected_factor.csv --work_dir={CLEAN_DATA_FOLDER} --output_dir={PREDICTED_FOLDER}
+# %run penalized_linear_hackathon.py --data=selected_data.parquet --factor=selected_factor.csv --work_dir={CLEAN_DATA_FOLDER} --output_dir={PREDICTED_FOLDER}
 
 
 # <a name="4"></a>
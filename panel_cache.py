@@ -0,0 +1,171 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# Binary cache of the modeling panel: one `.npy` file per array plus a small `manifest.json`.
+# Arrays are opened with `mmap_mode='r'`, so start-up is near-instant and the pages are shared
+# by every process that opens the same cache instead of each one loading a private copy.
+# Rows are sorted by `date`, so every date range is one contiguous block and `Panel.window` returns
+# it as a slice (a view into the arrays, not a copy) found by binary search on the dates.
+# The cache is built from the source file in chunks, so the whole panel never has to fit in a DataFrame:
+# a first pass reads only the `date` / `permno` keys to find the sorted position of every row, a second pass
+# writes each chunk's rows at their positions into `.npy` files preallocated as memory maps.
+
+MANIFEST_FILE = 'manifest.json'
+LAYOUT = 'date_sorted'
+KEY_ARRAYS = ['year', 'month', 'date', 'permno']
+
+
+class Panel:
+    """Factor matrix `X`, target `y` and the `year/month/date/permno` keys of a panel, rows sorted by date"""
+
+    def __init__(self, X, y, keys, stock_vars, ret_var):
+        self.X = X
+        self.y = y
+        self.keys = keys
+        self.stock_vars = list(stock_vars)
+        self.ret_var = ret_var
+
+    def __len__(self):
+        return len(self.y)
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, stock_vars, ret_var):
+        data = data.sort_values(['date', 'permno'], kind='stable')
+        X = np.ascontiguousarray(data[stock_vars].to_numpy(dtype=np.float64))
+        y = data[ret_var].to_numpy(dtype=np.float64)
+        keys = {name: data[name].to_numpy() for name in KEY_ARRAYS}
+        return cls(X, y, keys, stock_vars, ret_var)
+
+    def window(self, start, end) -> slice:
+        # Rows with `start <= date < end`, located by binary search on the sorted dates
+        dates = self.keys['date']
+        return slice(int(np.searchsorted(dates, np.datetime64(start), side='left')),
+                     int(np.searchsorted(dates, np.datetime64(end), side='left')))
+
+    def frame(self, rows=slice(None)):
+        # Rebuild the `year/month/date/permno/ret_var` frame of the selected rows (e.g. for the predictions output)
+        frame = pd.DataFrame({name: self.keys[name][rows] for name in KEY_ARRAYS})
+        frame[self.ret_var] = self.y[rows]
+        return frame
+
+
+def _source_signature(*paths):
+    # Size and modification time of the source files, used to detect a stale cache
+    return {path: [os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths if os.path.exists(path)}
+
+def _write_manifest(cache_dir, stock_vars, ret_var, arrays: dict, sources=[]):
+    manifest = {
+        'stock_vars': list(stock_vars),
+        'ret_var': ret_var,
+        'layout': LAYOUT,
+        'n_rows': len(arrays['y']),
+        'arrays': {name: {'dtype': str(array.dtype), 'shape': list(array.shape)} for name, array in arrays.items()},
+        'sources': _source_signature(*sources),
+    }
+    # Write the manifest last, a cache without one is treated as missing
+    with open(os.path.join(cache_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Saved panel cache `{cache_dir}` ({len(arrays['y'])} rows x {len(stock_vars)} factors).")
+
+def save_panel(panel: Panel, cache_dir, sources=[]):
+    # Cache of a panel already in memory
+    os.makedirs(cache_dir, exist_ok=True)
+    arrays = {'X': panel.X, 'y': panel.y, **panel.keys}
+    for name, array in arrays.items():
+        np.save(os.path.join(cache_dir, f'{name}.npy'), np.ascontiguousarray(array))
+    _write_manifest(cache_dir, panel.stock_vars, panel.ret_var, arrays, sources)
+
+def write_panel_chunks(data_file, cache_dir, stock_vars, ret_var, chunksize=500_000, sources=[]):
+    """Write the panel cache of `data_file` chunk by chunk, rows sorted by `date` then `permno` like `Panel.from_frame`"""
+    from storage import read_chunks
+    os.makedirs(cache_dir, exist_ok=True)
+    # A rebuild interrupted half-way must not look like a valid cache
+    if os.path.exists(os.path.join(cache_dir, MANIFEST_FILE)):
+        os.remove(os.path.join(cache_dir, MANIFEST_FILE))
+
+    # Pass 1: the keys only, the stable sort gives the destination row of every source row
+    keys = [(chunk['date'].to_numpy(), chunk['permno'].to_numpy())
+            for chunk in read_chunks(data_file, chunksize, parse_dates=['date'], columns=['date', 'permno'])]
+    dates, permnos = (np.concatenate(column) for column in zip(*keys))
+    del keys
+    order = np.lexsort((permnos, dates))
+    destination = np.empty(len(order), dtype=np.int64)
+    destination[order] = np.arange(len(order))
+
+    def new_array(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(cache_dir, f'{name}.npy'), mode='w+', dtype=dtype, shape=shape)
+
+    arrays = {'X': new_array('X', np.float64, (len(order), len(stock_vars))), 'y': new_array('y', np.float64, (len(order),))}
+    for name, values in [('date', dates), ('permno', permnos)]:
+        arrays[name] = new_array(name, values.dtype, values.shape)
+        arrays[name][:] = values[order]
+    del dates, permnos, order
+
+    # Pass 2: every chunk's rows written at their sorted positions
+    start = 0
+    for chunk in read_chunks(data_file, chunksize, columns=['year', 'month', ret_var] + list(stock_vars)):
+        rows = destination[start:start + len(chunk)]
+        for name in ['year', 'month']:
+            if name not in arrays:
+                arrays[name] = new_array(name, chunk[name].dtype, destination.shape)
+            arrays[name][rows] = chunk[name].to_numpy()
+        arrays['X'][rows] = chunk[stock_vars].to_numpy(dtype=np.float64)
+        arrays['y'][rows] = chunk[ret_var].to_numpy(dtype=np.float64)
+        start += len(chunk)
+
+    arrays = {name: arrays[name] for name in ['X', 'y'] + KEY_ARRAYS}
+    for array in arrays.values():
+        array.flush()
+    _write_manifest(cache_dir, stock_vars, ret_var, arrays, sources)
+
+def read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def is_fresh(cache_dir, sources=[]):
+    manifest = read_manifest(cache_dir)
+    return (manifest is not None
+            and manifest.get('layout') == LAYOUT
+            and manifest['sources'] == _source_signature(*sources))
+
+def open_panel(cache_dir, mmap_mode='r') -> Panel:
+    manifest = read_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No panel cache in `{cache_dir}`, build it with `python panel_cache.py` first.")
+
+    arrays = {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode=mmap_mode) for name in manifest['arrays']}
+    keys = {name: arrays[name] for name in KEY_ARRAYS}
+    print(f"Opened panel cache `{cache_dir}`.")
+    return Panel(arrays['X'], arrays['y'], keys, manifest['stock_vars'], manifest['ret_var'])
+
+def build_panel_cache(factor_file, data_file, cache_dir, ret_var='stock_exret', force=False):
+    """Convert a data/factor file pair into a panel cache once, later calls reuse it while the sources are unchanged"""
+    if force or not is_fresh(cache_dir, sources=[factor_file, data_file]):
+        from storage import read_file
+        stock_vars = list(read_file(factor_file)["variable"].values)
+        write_panel_chunks(data_file, cache_dir, stock_vars, ret_var, sources=[factor_file, data_file])
+    return open_panel(cache_dir)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Convert a data/factor file pair into a memory-mapped panel cache.')
+    parser.add_argument('--data', type=str, default='data.csv', help='Path to the data file')
+    parser.add_argument('--factor', type=str, default='factor.csv', help='Path to the factor file')
+    parser.add_argument('--work_dir', type=str, default='', help='Working directory (optional)')
+    parser.add_argument('--cache_dir', type=str, default='panel_cache', help='Directory of the cache, relative to the working directory')
+    parser.add_argument('--force', action='store_true', help='Rebuild the cache even if the sources did not change')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    build_panel_cache(factor_file=os.path.join(args.work_dir, args.factor),
+                      data_file=os.path.join(args.work_dir, args.data),
+                      cache_dir=os.path.join(args.work_dir, args.cache_dir),
+                      force=args.force)
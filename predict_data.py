@@ -3,67 +3,156 @@ import pandas as pd
 import numpy as np
 import os
 import argparse
+import glob
+import shutil
+import tempfile
+import joblib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.preprocessing import RobustScaler
 from sklearn.linear_model import LinearRegression, LassoCV, RidgeCV, ElasticNetCV
 from sklearn.model_selection import TimeSeriesSplit, GridSearchCV
 from xgboost import XGBRegressor
 from sklearn.metrics import mean_squared_error, r2_score
 from typing import List, Tuple
+from storage import save_file, read_file, CheckpointedWriter
+from cleaning import read_cleaning_scheme
+from panel_cache import Panel, build_panel_cache, open_panel, save_panel
+from xgb_search import budgeted_search, quantized_grid_search, fit_quantized
+from linear_engine import GramLinearModels
+from scheduler import CoreBudget
+from cv_splits import MonthFolds, month_index
+from xgb_external import window_scaling, scaled_rows, fit_external
+
+# Columns kept next to the factors, everything else in the data file is not read
+KEY_VARS = ["year", "month", "date", "permno", "stock_exret"]
+
+# Columns of the per-window XGBoost search record (`xgb_params.csv`), followed by the chosen `xgb_*` parameters
+SEARCH_VARS = ["search", "evaluated", "candidates", "rmse", "seconds"]
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Run penalized linear regression with custom data and factor files.')
-    parser.add_argument('--data', type=str, default='data.csv', help='Path to the data CSV file')
-    parser.add_argument('--factor', type=str, default='factor.csv', help='Path to the factor CSV file')
+    parser.add_argument('--data', type=str, default='data.csv', help='Path to the data file, format is picked from the extension (.csv, .parquet, .feather)')
+    parser.add_argument('--factor', type=str, default='factor.csv', help='Path to the factor file, format is picked from the extension (.csv, .parquet, .feather)')
     parser.add_argument('--work_dir', type=str, default='', help='Working directory (optional)')
     parser.add_argument('--output_dir', type=str, default='', help='Directory to save output files (optional)')
+    parser.add_argument('--cache', type=str, default='', help='Memory-mapped panel cache directory, relative to the working directory. Built from `--data`/`--factor` on first use (optional)')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of windows trained in parallel processes, workers share the pages of `--cache` (of a temporary cache in the output directory without it, optional)')
+    parser.add_argument('--cores', type=int, default=0, help='Total core budget shared by the windows, the grid search and the XGBoost / BLAS threads (0 = all cores, optional)')
+    parser.add_argument('--grid_jobs', type=int, default=1, help='With `--xgb_matrix=sklearn`, GridSearchCV candidates trained at the same time, the window\'s cores are split between them (optional)')
+    parser.add_argument('--xgb_warm_start', type=int, default=0, help='Continue boosting the previous window\'s XGBoost model with this many new rounds instead of refitting it, XGBoost keeps the scaling of the last full refit of the chain, the other models are unaffected (0 = off, optional)')
+    parser.add_argument('--xgb_refit_every', type=int, default=5, help='With `--xgb_warm_start`, rerun the full XGBoost grid search every N windows (0 = never, optional)')
+    parser.add_argument('--xgb_search', type=str, default='grid', choices=['grid', 'budget'], help='XGBoost tuning: exhaustive `grid` search, or `budget` early-stopping search seeded with the previous window\'s winner (optional)')
+    parser.add_argument('--xgb_matrix', type=str, default='quantized', choices=['quantized', 'sklearn'], help='XGBoost grid search on `quantized` matrices built once per fold and window, or on the arrays with sklearn\'s GridSearchCV (optional)')
+    parser.add_argument('--xgb_search_budget', type=float, default=0, help='With `--xgb_search=budget`, seconds after which no new candidate is tried (0 = no limit, optional)')
+    parser.add_argument('--resume', action='store_true', help='Keep the windows already written to the output by an interrupted run and only train the others (optional)')
+    parser.add_argument('--linear', type=str, default='sklearn', choices=['sklearn', 'gram'], help='Fit OLS/lasso/ridge/en with sklearn on the rows, or from per-year `gram` statistics accumulated across windows, tuned on year-block folds instead of sklearn\'s row KFold (optional)')
+    parser.add_argument('--cv', type=str, default='rows', choices=['rows', 'expanding', 'blocked'], help='Tuning folds: `rows` (TimeSeriesSplit for XGBoost, 5-fold KFold for the linear models), or month-grouped `expanding` / `blocked` folds shared by every model, the last one is the early-stopping fold of `--xgb_search=budget` (not with `--linear=gram`, optional)')
+    parser.add_argument('--cv_splits', type=int, default=3, help='With month-grouped `--cv`, number of folds (optional)')
+    parser.add_argument('--purge_months', type=int, default=1, help='With month-grouped `--cv`, months before each validation block left out of training (optional)')
+    parser.add_argument('--embargo_months', type=int, default=1, help='With `--cv=blocked`, months after each validation block left out of training (optional)')
+    parser.add_argument('--external_memory', action='store_true', help='Train XGBoost on each window streamed by blocks from `--cache` (needs `--linear=gram`), for panels larger than memory (optional)')
+    parser.add_argument('--block_rows', type=int, default=200_000, help='With `--external_memory`, rows per block streamed to XGBoost (optional)')
+    parser.add_argument('--tune_rows', type=int, default=500_000, help='With `--external_memory`, most recent rows of the window used by the XGBoost search (optional)')
+    parser.add_argument('--sample_rows', type=int, default=1_000_000, help='With `--external_memory`, rows spread over the window used to fit the RobustScaler (optional)')
+    parser.add_argument('--save_models', type=str, default='', help='Directory, relative to the output directory, where the fitted models and scaling of every window are saved to score new months with `append_month.py` (optional)')
     return parser.parse_args()
 
-def save_file(df, file_name='file.csv', with_index=False):
-    df.to_csv(file_name, index=with_index)
-    print(f"Saved `{file_name}`.")
-
-def read_file(file_name='file.csv', parse_dates=[]):
-    print(f"Read `{file_name}`.")
-    return pd.read_csv(file_name, parse_dates=parse_dates)
-
-def inputData(factor_file, data_file):
+def inputData(factor_file, data_file, key_vars=KEY_VARS):
     factor = list(read_file(factor_file)["variable"].values)
-    data = read_file(data_file, parse_dates=['date'])
+    # Only read the factors and the key columns (column projection for columnar formats)
+    data = read_file(data_file, parse_dates=['date'], columns=key_vars + factor)
     return factor, data
 
 def outputData(factor, data, factor_file, data_file):
     save_file(pd.DataFrame({'variable': factor}), factor_file)
     save_file(data, data_file)
 
-def split_data(data: pd.DataFrame, cutoff: List[pd.Timestamp], stock_vars: List[str], ret_var: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, pd.DataFrame]:
-    # Vectorized splitting using boolean indexing
-    train = data[(data["date"] >= cutoff[0]) & (data["date"] < cutoff[1])]
-    test = data[(data["date"] >= cutoff[1]) & (data["date"] < cutoff[2])]
-
-    X_train = train[stock_vars].values
-    X_test = test[stock_vars].values
-
-    Y_train = train[ret_var].values
-    Y_test = test[ret_var].values
+class WindowBuffers:
+    """Reusable output arrays for the scaled windows, grown only when a window is larger than any before"""
+
+    def __init__(self, n_features: int, capacity: int = 0):
+        self.n_features = n_features
+        self.arrays = {}
+        if capacity:
+            self.get('X_train', capacity)
+            self.get('Y_train', capacity)
+
+    def get(self, name: str, n_rows: int) -> np.ndarray:
+        array = self.arrays.get(name)
+        if array is None or len(array) < n_rows:
+            shape = (n_rows, self.n_features) if name.startswith('X') else (n_rows,)
+            array = self.arrays[name] = np.empty(shape)
+        return array[:n_rows]
+
+def split_data(panel: Panel, cutoff: List[pd.Timestamp], buffers: WindowBuffers = None, scaling: tuple = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, pd.DataFrame, tuple]:
+    # Rows are sorted by date, so each window is a slice found by binary search and indexing returns views
+    train = panel.window(cutoff[0], cutoff[1])
+    test = panel.window(cutoff[1], cutoff[2])
+
+    X_train = panel.X[train]
+    X_test = panel.X[test]
+
+    Y_train = panel.y[train]
+    Y_test = panel.y[test]
+
+    if buffers is None:
+        buffers = WindowBuffers(len(panel.stock_vars))
+
+    # Scale the features using RobustScaler statistics (or the given `scaling`, e.g. of an earlier window),
+    # written in place into the reusable buffers
+    if scaling is None:
+        scaler = RobustScaler().fit(X_train)
+        scaling = (scaler.center_, scaler.scale_, np.mean(Y_train))
+    center, scale, Y_mean = scaling
+    X_train_scaled = np.subtract(X_train, center, out=buffers.get('X_train', len(X_train)))
+    X_train_scaled /= scale
+    X_test_scaled = np.subtract(X_test, center, out=buffers.get('X_test', len(X_test)))
+    X_test_scaled /= scale
+
+    # Mean-adjusted Y_train_dm
+    Y_train_dm = np.subtract(Y_train, Y_mean, out=buffers.get('Y_train', len(Y_train)))
+
+    # The scaling is also returned for models fitted from statistics of the unscaled rows
+
+    return X_train_scaled, Y_train_dm, X_test_scaled, np.array(Y_test), panel.frame(test), scaling
+
+def split_external(panel: Panel, cutoff: List[pd.Timestamp], tune_rows: int = 500_000, sample_rows: int = 1_000_000, **external):
+    # Same outputs as `split_data` without materializing the training window: the scaling comes from a sample of it,
+    # and the training arrays are only its most recent `tune_rows` rows, for the XGBoost search
+    train = panel.window(cutoff[0], cutoff[1])
+    test = panel.window(cutoff[1], cutoff[2])
+    scaling = window_scaling(panel, train, sample_rows)
+    tune = slice(max(train.start, train.stop - tune_rows), train.stop)
+    X_tune, Y_tune = scaled_rows(panel, tune, scaling)
+    X_test = scaled_rows(panel, test, scaling)[0]
+    return X_tune, Y_tune, X_test, np.array(panel.y[test]), panel.frame(test), scaling, tune
+
+def warm_starts(xgb_state: dict, xgb_warm_start: int = 0, xgb_refit_every: int = 5) -> bool:
+    # Whether the next window continues the previous XGBoost model instead of rerunning the full search
+    return (xgb_warm_start > 0 and xgb_state.get('booster') is not None
+            and (xgb_refit_every <= 0 or xgb_state['since_refit'] < xgb_refit_every))
+
+def train_and_predict(X_train: np.ndarray, Y_train: np.ndarray, X_test: np.ndarray, n_jobs: int = -1,
+                      xgb_state: dict = None, xgb_warm_start: int = 0, xgb_refit_every: int = 5,
+                      xgb_search: str = 'grid', xgb_search_budget: float = 0, xgb_matrix: str = 'quantized',
+                      linear_predictions: dict = None, fitted_models: dict = None, budget: CoreBudget = None,
+                      cv_folds: MonthFolds = None, xgb_refit=None, xgb_data: tuple = None) -> dict:
+    # Outer jobs / inner threads of every model, `n_jobs` cores when no budget is given
+    budget = budget if budget is not None else CoreBudget(cores=n_jobs if n_jobs > 0 else 0)
+    xgb_threads = budget.threads('xgb')
+
+    # The window's month-grouped folds are the CV of every model, otherwise row-based folds
+    linear_cv = cv_folds if cv_folds is not None else 5
+    xgb_cv = cv_folds if cv_folds is not None else TimeSeriesSplit(n_splits=3)
+    n_folds = cv_folds.get_n_splits() if cv_folds is not None else 5
 
-    # Scale the features using RobustScaler
-    scaler = RobustScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-
-    # Calculate mean of Y_train and create mean-adjusted Y_train_dm
-    Y_mean = np.mean(Y_train)
-    Y_train_dm = Y_train - Y_mean
-
-    return X_train_scaled, Y_train_dm, X_test_scaled, Y_test, test[["year", "month", "date", "permno", ret_var]]
-
-def train_and_predict(X_train: np.ndarray, Y_train: np.ndarray, X_test: np.ndarray) -> dict:
     # Using cross-validated models to find the best alpha automatically
     models = {
         'ols': LinearRegression(),
-        'lasso': LassoCV(cv=5),
-        'ridge': RidgeCV(cv=5),
-        'en': ElasticNetCV(cv=5),  # Automatically tunes alpha and l1_ratio
+        'lasso': LassoCV(cv=linear_cv, n_jobs=budget.plan('lasso', n_folds)[0]),
+        'ridge': RidgeCV(cv=linear_cv),
+        'en': ElasticNetCV(cv=linear_cv, n_jobs=budget.plan('en', n_folds)[0]),  # Automatically tunes alpha and l1_ratio
         'xgb': XGBRegressor()  # Placeholder for XGBoost
     }
 
@@ -77,24 +166,174 @@ def train_and_predict(X_train: np.ndarray, Y_train: np.ndarray, X_test: np.ndarr
     }
 
     # Initialize GridSearchCV for XGBoost
-    xgb_model = GridSearchCV(XGBRegressor(objective='reg:squarederror', random_state=42),
+    grid_jobs, grid_threads = budget.plan('xgb_grid')
+    xgb_model = GridSearchCV(XGBRegressor(objective='reg:squarederror', random_state=42, n_jobs=grid_threads),
                              param_grid=xgb_params, 
                              scoring='neg_mean_squared_error', 
-                             cv=TimeSeriesSplit(n_splits=3), 
-                             n_jobs=-1)
+                             cv=xgb_cv, 
+                             n_jobs=grid_jobs)
 
     # Update the model dictionary
     models['xgb'] = xgb_model
 
-    # Fit all models and predict in a single loop
-    predictions = {name: model.fit(X_train, Y_train).predict(X_test) for name, model in models.items()}
-    
+    # Linear models already fitted from sufficient statistics
+    if linear_predictions is not None:
+        models = {'xgb': xgb_model}
+    fit_params = {}
+    xgb_state = xgb_state if xgb_state is not None else {}
+    search = None
+
+    # Warm start: the training set only grew by one year, so keep boosting the previous window's model
+    # on the enlarged window with the last search winner, and rerun the full search every `xgb_refit_every` windows
+    warm_start = warm_starts(xgb_state, xgb_warm_start, xgb_refit_every)
+    if warm_start:
+        models['xgb'] = XGBRegressor(objective='reg:squarederror', random_state=42, n_jobs=xgb_threads, **{**xgb_state['params'], 'n_estimators': xgb_warm_start})
+        fit_params['xgb'] = {'xgb_model': xgb_state['booster']}
+    elif xgb_search == 'budget':
+        # Early-stopping search seeded with the previous window's winner, then a single refit with the chosen parameters
+        search = budgeted_search(X_train, Y_train, xgb_params, seed_params=xgb_state.get('params'), time_budget=xgb_search_budget,
+                                 cv=cv_folds, objective='reg:squarederror', random_state=42, n_jobs=xgb_threads)
+    elif xgb_matrix == 'quantized':
+        # Same grid and folds as the GridSearchCV, each fold quantized once for all the candidates
+        search = quantized_grid_search(X_train, Y_train, xgb_params, cv=xgb_cv,
+                                       objective='reg:squarederror', random_state=42, n_jobs=xgb_threads)
+
+    # Refit of the searched parameters on the window quantized once (or with `xgb_refit`, e.g. streamed from disk
+    # when `X_train` is only a sample of the window), the test rows are predicted in place
+    prefit = set()
+    if search is not None:
+        refit = xgb_refit if xgb_refit is not None else partial(fit_quantized, X_train, Y_train)
+        models['xgb'] = refit(search['params'], objective='reg:squarederror', random_state=42, n_jobs=xgb_threads)
+        prefit.add('xgb')
+
+    # Fit all models and predict in a single loop, each within its share of BLAS / OpenMP threads
+    predictions = {}
+    # `xgb_data`: training / test matrices of XGBoost scaled differently from the other models (warm start), and the
+    # offset bringing its predictions back to the window's target mean
+    for name, model in models.items():
+        X_fit, Y_fit, X_pred, offset = xgb_data if name == 'xgb' and xgb_data is not None else (X_train, Y_train, X_test, 0)
+        with budget.limits(name):
+            if name not in prefit:
+                model.fit(X_fit, Y_fit, **fit_params.get(name, {}))
+            predictions[name] = model.predict(X_pred) + offset
+    predictions = {**(linear_predictions or {}), **predictions}
+
+    # Keep the chosen XGBoost parameters for the next window (seed / warm start) and for the per-window record
+    if warm_start:
+        xgb_state.update(since_refit=xgb_state['since_refit'] + 1, search={'search': 'warm_start'})
+    elif search is None:
+        xgb_state.update(params=xgb_model.best_params_, since_refit=1,
+                         search={'search': 'grid', 'evaluated': len(xgb_model.cv_results_['params']), 'rmse': np.sqrt(-xgb_model.best_score_)})
+        models['xgb'] = xgb_model.best_estimator_
+    else:
+        xgb_state.update(params=search['params'], since_refit=1,
+                         search={'search': xgb_search, 'rmse': search['val_rmse'], **{k: search[k] for k in ['evaluated', 'candidates', 'seconds']}})
+    if xgb_warm_start > 0:
+        xgb_state['booster'] = models['xgb'].get_booster()
+
+    # The fitted models of the window, when asked for
+    if fitted_models is not None:
+        fitted_models.update(models)
+
     return predictions
 
+def expanding_windows(starting: pd.Timestamp, ending: pd.Timestamp, train_years: int = 10) -> List[List[pd.Timestamp]]:
+    # [train start, train end / test start, test end] of every yearly window, the training set always starts at `starting`
+    windows = []
+    counter = 0
+    while (starting + pd.DateOffset(years=train_years + 1 + counter)) <= ending:
+        windows.append([starting + pd.DateOffset(years=i) for i in [0, train_years+counter, train_years+1+counter]])
+        counter += 1
+    return windows
+
+def save_window_models(models_dir: str, cutoff: List[pd.Timestamp], models: dict, scaling: tuple, stock_vars: List[str],
+                       cleaning: dict = None, model_scaling: dict = None):
+    # One file per window, named after the first predicted date, with the cleaning scheme of the panel (None if unknown)
+    # and the scaling of the models not trained on the window's own one (the warm-started XGBoost)
+    os.makedirs(models_dir, exist_ok=True)
+    center, scale, y_mean = scaling
+    joblib.dump({'cutoff': cutoff, 'stock_vars': list(stock_vars), 'center': center, 'scale': scale, 'y_mean': y_mean, 'models': models,
+                 'cleaning': cleaning, 'model_scaling': model_scaling or {}},
+                os.path.join(models_dir, f'window_{cutoff[1]:%Y%m%d}.joblib'))
+
+def load_window_models(models_dir: str) -> dict:
+    # Models of the latest window saved by `--save_models`
+    files = sorted(glob.glob(os.path.join(models_dir, 'window_*.joblib')))
+    if not files:
+        raise FileNotFoundError(f"No saved window models in `{models_dir}`, run `predict_data.py --save_models` first.")
+    print(f"Read `{files[-1]}`.")
+    return joblib.load(files[-1])
+
+def run_window(panel: Panel, cutoff: List[pd.Timestamp], buffers: WindowBuffers = None, n_jobs: int = -1,
+               linear_engine: GramLinearModels = None, models_dir: str = None, cleaning: dict = None, cv: dict = None,
+               external: dict = None, **model_options) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    xgb_state = model_options.setdefault('xgb_state', {})
+    model_scaling = {}
+    if external is not None:
+        # The search sees the most recent rows, the chosen XGBoost is then trained on the whole window block by block
+        X_train, Y_train, X_test, Y_test, reg_pred, scaling, train_rows = split_external(panel, cutoff, **external)
+        model_options['xgb_refit'] = partial(fit_external, panel, panel.window(cutoff[0], cutoff[1]), scaling,
+                                             block_rows=external['block_rows'], cache_dir=external['cache_dir'])
+    else:
+        X_train, Y_train, X_test, Y_test, reg_pred, scaling = split_data(panel, cutoff, buffers)
+        train_rows = panel.window(cutoff[0], cutoff[1])
+        # A warm-started booster keeps splitting on the features as scaled for its first trees, so its matrices in the
+        # warm-start chain are scaled with the center / scale / target mean of its last full refit (own buffers),
+        # the other models keep the window's scaling
+        if warm_starts(xgb_state, model_options.get('xgb_warm_start', 0), model_options.get('xgb_refit_every', 5)):
+            xgb_buffers = xgb_state.setdefault('buffers', WindowBuffers(len(panel.stock_vars)))
+            X_xgb, Y_xgb, X_xgb_test, _, _, model_scaling['xgb'] = split_data(panel, cutoff, xgb_buffers, xgb_state['scaling'])
+            model_options['xgb_data'] = (X_xgb, Y_xgb, X_xgb_test, model_scaling['xgb'][2] - scaling[2])
+        elif model_options.get('xgb_warm_start', 0) > 0:
+            xgb_state['scaling'] = scaling
+    if cv is not None:
+        # Month-grouped folds of the training rows, computed once for all the models
+        model_options['cv_folds'] = MonthFolds(month_index(panel.keys, train_rows), **cv)
+    if linear_engine is not None:
+        model_options['linear_predictions'] = linear_engine.fit_predict(panel, cutoff, *scaling, X_test)
+    fitted_models = {} if models_dir else None
+    predictions = train_and_predict(X_train, Y_train, X_test, n_jobs=n_jobs, fitted_models=fitted_models, **model_options)
+
+    if models_dir:
+        if linear_engine is not None:
+            fitted_models.update(linear_engine.fitted)
+        save_window_models(models_dir, cutoff, fitted_models, scaling, panel.stock_vars, cleaning, model_scaling)
+
+    for name, pred in predictions.items():
+        reg_pred[name] = pred
+
+    # Chosen XGBoost parameters of the window, with the same columns for every window
+    record = {'train_start': cutoff[0].year, 'train_end': cutoff[1].year, 'predict_end': cutoff[2].year,
+              **{name: xgb_state['search'].get(name) for name in SEARCH_VARS},
+              **{f'xgb_{name}': xgb_state['params'][name] for name in sorted(xgb_state['params'])}}
+    return reg_pred, pd.DataFrame([record])
+
+# State of a `--jobs` worker process, set once by `init_worker`
+_worker = {}
+
+def init_worker(panel_source, n_jobs, model_options):
+    # A cache directory is opened memory-mapped, so all workers share the same pages instead of private copies
+    panel = open_panel(panel_source) if isinstance(panel_source, str) else panel_source
+    # Each worker seeds its XGBoost search with the last window it trained itself, and keeps its own per-year statistics
+    if model_options.get('linear_engine') is not None:
+        model_options = {**model_options, 'linear_engine': GramLinearModels()}
+    _worker.update(panel=panel, buffers=WindowBuffers(len(panel.stock_vars)), n_jobs=n_jobs, model_options={**model_options, 'xgb_state': {}})
+
+def run_worker_window(cutoff: List[pd.Timestamp]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    return run_window(_worker['panel'], cutoff, _worker['buffers'], _worker['n_jobs'], **_worker['model_options'])
+
 
 if __name__ == "__main__":
     # Parse command-line arguments
     args = parse_arguments()
+    if args.jobs > 1 and args.xgb_warm_start:
+        raise ValueError("`--xgb_warm_start` continues the previous window's model, it cannot run with `--jobs` > 1.")
+    if args.cv != 'rows' and args.linear == 'gram':
+        raise ValueError("`--linear=gram` tunes on its own year-block folds, it cannot use the month-grouped `--cv` folds.")
+    if args.external_memory and (not args.cache or args.linear != 'gram' or args.xgb_warm_start
+                                 or (args.xgb_search == 'grid' and args.xgb_matrix == 'sklearn')):
+        raise ValueError("`--external_memory` streams the windows from `--cache`, with `--linear=gram`, without `--xgb_warm_start` "
+                         "and with the quantized or budget XGBoost search.")
 
     pd.set_option("mode.chained_assignment", None)
     print(datetime.datetime.now())
@@ -118,41 +357,86 @@ if __name__ == "__main__":
         work_dir, args.factor
     )  # replace with the correct file name
 
-    # Assuming inputData returns a tuple of stock_vars and clean data DataFrame
-    stock_vars, data = inputData(factor_file=factor_path, data_file=data_path)
     ret_var = "stock_exret"
 
+    if args.cache:
+        # Convert the data once into memory-mapped arrays, later runs open them in milliseconds
+        panel = build_panel_cache(factor_file=factor_path, data_file=data_path, cache_dir=os.path.join(work_dir, args.cache), ret_var=ret_var)
+    else:
+        # Assuming inputData returns a tuple of stock_vars and clean data DataFrame
+        stock_vars, data = inputData(factor_file=factor_path, data_file=data_path)
+        panel = Panel.from_frame(data, stock_vars, ret_var)
+        del data
+    stock_vars = panel.stock_vars
+
     starting = pd.to_datetime("20000101", format="%Y%m%d")
-    counter = 0
-    pred_out = pd.DataFrame()
+    windows = expanding_windows(starting, pd.to_datetime("20240101", format="%Y%m%d"))
+
+    # Each finished window is appended to the outputs right away and checkpointed, `--resume` skips those windows
+    writer = CheckpointedWriter({'predictions': output_path, 'xgb_params': os.path.join(output_dir, "xgb_params.csv")}, resume=args.resume)
+    window_key = lambda cutoff: '_'.join(f'{date:%Y%m%d}' for date in cutoff)
+    skipped = [cutoff for cutoff in windows if writer.done(window_key(cutoff))]
+    windows = [cutoff for cutoff in windows if not writer.done(window_key(cutoff))]
+    for cutoff in skipped:
+        print(f'[Done] Train:{cutoff[0].year}-{cutoff[1].year} | Predict:{cutoff[1].year}-{cutoff[2].year}')
 
     start_time = datetime.datetime.now()
 
-    while (starting + pd.DateOffset(years=11 + counter)) <= pd.to_datetime("20240101", format="%Y%m%d"):
-        cutoff = [starting + pd.DateOffset(years=i) for i in [0, 10+counter, 11+counter]]
-        print(f'[Processing...] Train:{cutoff[0].year}-{cutoff[1].year} | Predict:{cutoff[1].year}-{cutoff[2].year} ', end='')
-        
-        X_train, Y_train, X_test, Y_test, reg_pred = split_data(data, cutoff, stock_vars, ret_var)
-        predictions = train_and_predict(X_train, Y_train, X_test)
-        
-        for name, pred in predictions.items():
-            reg_pred[name] = pred
-        
-        pred_out = pd.concat([pred_out, reg_pred], ignore_index=True)
+    model_options = {'xgb_warm_start': args.xgb_warm_start, 'xgb_refit_every': args.xgb_refit_every,
+                     'xgb_search': args.xgb_search, 'xgb_search_budget': args.xgb_search_budget, 'xgb_matrix': args.xgb_matrix,
+                     'linear_engine': GramLinearModels() if args.linear == 'gram' else None,
+                     'models_dir': os.path.join(output_dir, args.save_models) if args.save_models else None,
+                     'cleaning': read_cleaning_scheme(data_path),
+                     'budget': CoreBudget(cores=args.cores, windows=args.jobs, grid_jobs=args.grid_jobs),
+                     'external': {'block_rows': args.block_rows, 'tune_rows': args.tune_rows, 'sample_rows': args.sample_rows,
+                                  'cache_dir': os.path.join(work_dir, args.cache)} if args.external_memory else None,
+                     'cv': None if args.cv == 'rows' else {'n_splits': args.cv_splits, 'scheme': args.cv, 'purge_months': args.purge_months, 'embargo_months': args.embargo_months}}
+    print(model_options['budget'].describe())
+
+    if args.jobs > 1:
+        # Windows are independent: send them to a process pool, `map` still yields the results in window order.
+        # Each window gets its share of the core budget for the models inside it.
+        print(f"Running {len(windows)} windows on {args.jobs} processes")
+        # The workers open the panel memory-mapped and share its pages, without `--cache` the panel read in memory is
+        # written once to a temporary cache (instead of a private copy pickled into every worker)
+        temporary_cache = None if args.cache else tempfile.mkdtemp(prefix='panel_cache_', dir=output_dir)
+        if temporary_cache:
+            save_panel(panel, temporary_cache)
+            panel = open_panel(temporary_cache)
+        executor = ProcessPoolExecutor(max_workers=args.jobs,
+                                       initializer=init_worker,
+                                       initargs=(os.path.join(work_dir, args.cache) if args.cache else temporary_cache,
+                                                 model_options['budget'].window_cores,
+                                                 model_options))
+        results = executor.map(run_worker_window, windows)
+    else:
+        # Sized for the largest (last) training window, so the buffers are allocated only once (not used when streaming)
+        buffers = WindowBuffers(len(stock_vars), capacity=0 if args.external_memory else len(panel))
+        # XGBoost parameters (and model when warm starting) carried over between windows
+        model_options['xgb_state'] = {}
+        results = (run_window(panel, cutoff, buffers, **model_options) for cutoff in windows)
+
+    for cutoff, (reg_pred, record) in zip(windows, results):
+        writer.write(window_key(cutoff), {'predictions': reg_pred, 'xgb_params': record})
 
         end_time = datetime.datetime.now()
         duration = end_time - start_time
+        print(f'[Processing...] Train:{cutoff[0].year}-{cutoff[1].year} | Predict:{cutoff[1].year}-{cutoff[2].year} ', end='')
         print(f"| {int(duration.total_seconds() // 60):02}:{int(duration.total_seconds() % 60):02}")
-        
-        # Go to the next year
-        counter += 1
+
+    if args.jobs > 1:
+        executor.shutdown()
+        if temporary_cache:
+            del panel
+            shutil.rmtree(temporary_cache, ignore_errors=True)
 
     end_time = datetime.datetime.now()
     duration = end_time - start_time
     print(f"Total Time: {int(duration.total_seconds() // 60):02}:{int(duration.total_seconds() % 60):02}")
 
 
-    save_file(pred_out, output_path)
+    print(f"Saved `{output_path}`.")
+    pred_out = read_file(output_path, parse_dates=['date'])
 
     yreal = pred_out[ret_var].values
     for model_name in ['ols', 'lasso', 'ridge', 'en', 'xgb']:
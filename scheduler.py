@@ -0,0 +1,49 @@
+import os
+from threadpoolctl import threadpool_limits
+
+# Core budget of `predict_data.py`, split between the nested levels of parallelism instead of every level
+# defaulting to all the cores (GridSearchCV workers x XGBoost threads x BLAS threads oversubscribe the machine):
+# - windows: `--jobs` processes, each one gets `cores // windows` cores
+# - inside a window, per model: outer jobs (grid candidates / CV folds run at the same time) x inner threads
+#   (XGBoost `n_jobs`, BLAS threads of the linear models), with outer x inner <= the window's cores
+# The XGBoost searches of `xgb_search.py` train one candidate at a time, so all the window's cores are XGBoost threads.
+
+class CoreBudget:
+    """Outer jobs and inner threads of every model, for `cores` cores (0 = all) shared by `windows` processes
+
+    `grid_jobs` is the number of XGBoost GridSearchCV candidates trained at the same time (`--xgb_matrix=sklearn`).
+    With `oversubscribe`, every level uses the libraries' defaults (all the cores), as before the budget.
+    """
+
+    def __init__(self, cores: int = 0, windows: int = 1, grid_jobs: int = 1, oversubscribe: bool = False):
+        self.cores = cores if cores > 0 else os.cpu_count()
+        self.windows = max(1, min(windows, self.cores))
+        self.window_cores = max(1, self.cores // self.windows)
+        self.grid_jobs = max(1, min(grid_jobs, self.window_cores))
+        self.oversubscribe = oversubscribe
+
+    def plan(self, model: str, cv_folds: int = 5) -> tuple:
+        # (outer jobs, inner threads) of a model, None leaves the library default
+        if self.oversubscribe:
+            return (-1, None) if model == 'xgb_grid' else (None, None)
+        if model == 'xgb_grid':
+            return self.grid_jobs, max(1, self.window_cores // self.grid_jobs)
+        if model in ('lasso', 'en'):
+            # The folds of the CV path run in parallel, each with its share of BLAS threads
+            folds = min(cv_folds, self.window_cores)
+            return folds, max(1, self.window_cores // folds)
+        # OLS / ridge (BLAS), XGBoost searches and refits: one job with all the window's cores
+        return 1, self.window_cores
+
+    def threads(self, model: str) -> int:
+        return self.plan(model)[1]
+
+    def limits(self, model: str):
+        # Context limiting the BLAS / OpenMP threads of a model's fit (no limit when oversubscribing)
+        return threadpool_limits(limits=self.threads(model))
+
+    def describe(self) -> str:
+        if self.oversubscribe:
+            return f"{self.windows} windows x library defaults (oversubscribed)"
+        return (f"{self.cores} cores: {self.windows} windows x {self.window_cores} cores, "
+                f"XGBoost grid {self.grid_jobs} jobs x {self.threads('xgb_grid')} threads")
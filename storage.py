@@ -0,0 +1,166 @@
+import os
+import json
+import pandas as pd
+
+# Storage formats are picked from the file extension, anything unknown is treated as CSV.
+# Columnar formats (Parquet / Feather) keep dtypes and dates, and can read a subset of columns without parsing the rest.
+
+def _read_csv(file_name, columns=None, parse_dates=[]):
+    return pd.read_csv(file_name, usecols=columns, parse_dates=parse_dates)
+
+def _write_csv(df, file_name, with_index=False):
+    df.to_csv(file_name, index=with_index)
+
+def _read_parquet(file_name, columns=None, parse_dates=[]):
+    return _to_datetime(pd.read_parquet(file_name, columns=columns), parse_dates)
+
+def _write_parquet(df, file_name, with_index=False):
+    df.to_parquet(file_name, index=with_index)
+
+def _read_feather(file_name, columns=None, parse_dates=[]):
+    return _to_datetime(pd.read_feather(file_name, columns=columns), parse_dates)
+
+def _write_feather(df, file_name, with_index=False):
+    # Feather cannot store a non-default index, so keep it as a column when asked to
+    df = df.reset_index() if with_index else df.reset_index(drop=True)
+    df.to_feather(file_name)
+
+def _to_datetime(df, parse_dates):
+    # Columnar files already keep datetimes, this only converts columns saved as text/integers
+    for col in parse_dates:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+FORMATS = {
+    '.csv': (_read_csv, _write_csv),
+    '.parquet': (_read_parquet, _write_parquet),
+    '.pq': (_read_parquet, _write_parquet),
+    '.feather': (_read_feather, _write_feather),
+    '.arrow': (_read_feather, _write_feather),
+}
+
+def register_format(extension, reader, writer):
+    """Register a `reader(file_name, columns, parse_dates)` and `writer(df, file_name, with_index)` pair for an extension"""
+    FORMATS[extension.lower()] = (reader, writer)
+
+def get_format(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    return FORMATS.get(extension, FORMATS['.csv'])
+
+def save_file(df, file_name='file.csv', with_index=False):
+    get_format(file_name)[1](df, file_name, with_index=with_index)
+    print(f"Saved `{file_name}`.")
+
+def read_file(file_name='file.csv', parse_dates=[], columns=None):
+    print(f"Read `{file_name}`.")
+    return get_format(file_name)[0](file_name, columns=columns, parse_dates=parse_dates)
+
+
+def _csv_chunks(file_name, chunksize, columns=None, parse_dates=[]):
+    yield from pd.read_csv(file_name, usecols=columns, parse_dates=parse_dates, chunksize=chunksize)
+
+def _parquet_chunks(file_name, chunksize, columns=None, parse_dates=[]):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(file_name).iter_batches(batch_size=chunksize, columns=columns):
+        yield _to_datetime(batch.to_pandas(), parse_dates)
+
+CHUNK_READERS = {
+    '.csv': _csv_chunks,
+    '.parquet': _parquet_chunks,
+    '.pq': _parquet_chunks,
+}
+
+def read_chunks(file_name='file.csv', chunksize=500_000, parse_dates=[], columns=None):
+    """Iterate over a file in frames of at most `chunksize` rows (formats without a chunked reader come in one frame)"""
+    print(f"Read `{file_name}` in chunks of {chunksize} rows.")
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in CHUNK_READERS:
+        yield from CHUNK_READERS[extension](file_name, chunksize, columns=columns, parse_dates=parse_dates)
+    else:
+        yield read_file(file_name, parse_dates=parse_dates, columns=columns)
+
+
+class FrameAppender:
+    """Writes frames one after another into a single CSV or Parquet file, without holding them all in memory"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.parquet = os.path.splitext(file_name)[1].lower() in ('.parquet', '.pq')
+        self.writer = None
+        self.rows = 0
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+    def append(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Later frames are cast to the schema of the first one (e.g. a text column that is all missing in a frame)
+            table = pa.Table.from_pandas(df, schema=self.writer.schema if self.writer else None, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.file_name, table.schema)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.file_name, mode='a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        print(f"Saved `{self.file_name}` ({self.rows} rows).")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CheckpointedWriter:
+    """Appends the results of each finished step to CSV files, with a checkpoint to resume after a crash
+
+    The checkpoint (`<first file>.checkpoint.json`) lists the finished steps and the committed size of every file.
+    On resume, the files are truncated back to those sizes (dropping a step that was half written) and the
+    finished steps can be skipped with `done`. A file missing or shorter than its committed size cannot be resumed.
+    """
+
+    def __init__(self, file_names: dict, resume=False):
+        self.file_names = file_names
+        self.checkpoint_file = list(file_names.values())[0] + '.checkpoint.json'
+        self.steps, self.sizes = [], {name: 0 for name in file_names}
+
+        if resume and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as f:
+                checkpoint = json.load(f)
+            self.steps, self.sizes = checkpoint['steps'], {name: checkpoint['sizes'].get(name, 0) for name in file_names}
+            for name, file_name in file_names.items():
+                size = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+                if size < self.sizes[name]:
+                    raise FileNotFoundError(f"`{file_name}` is missing or shorter than in `{self.checkpoint_file}`, "
+                                            f"rerun without resuming to start over.")
+            print(f"Resuming from `{self.checkpoint_file}`: {len(self.steps)} finished steps.")
+        elif os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+        # Truncating a missing file would create it, padded with null bytes up to the committed size
+        for name, file_name in file_names.items():
+            if os.path.exists(file_name):
+                os.truncate(file_name, self.sizes[name])
+
+    def done(self, step) -> bool:
+        return str(step) in self.steps
+
+    def write(self, step, frames: dict):
+        for name, df in frames.items():
+            with open(self.file_names[name], 'a', newline='') as f:
+                df.to_csv(f, header=self.sizes[name] == 0, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            self.sizes[name] = os.path.getsize(self.file_names[name])
+        self.steps.append(str(step))
+
+        # Replace the checkpoint atomically, so it is never half written
+        with open(self.checkpoint_file + '.tmp', 'w') as f:
+            json.dump({'steps': self.steps, 'sizes': self.sizes}, f)
+        os.replace(self.checkpoint_file + '.tmp', self.checkpoint_file)
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import numpy as np
+import xgboost as xgb
+from sklearn.preprocessing import RobustScaler
+from xgb_search import BoosterModel, native_params
+
+# External-memory XGBoost training of a window (`predict_data.py --external_memory`), for panels larger than RAM.
+# The rows of the memory-mapped panel cache are sorted by date, so the expanding window is one row range: it is
+# streamed to XGBoost in blocks of `block_rows` rows, each block scaled on the fly, and XGBoost keeps the quantized
+# pages in its own on-disk cache. Nothing of the size of the window is held in memory:
+# - the RobustScaler statistics are fitted on `sample_rows` rows spread over the window (the target mean is exact)
+# - the XGBoost search runs on the most recent `tune_rows` rows, the chosen parameters are then trained on the
+#   whole window from the blocks
+# - the linear models come from the per-year statistics of `linear_engine.py` (`--linear=gram`)
+
+
+def spread_rows(rows: slice, n: int) -> np.ndarray:
+    # At most `n` row indices evenly spaced over the range
+    return np.unique(np.linspace(rows.start, rows.stop - 1, min(n, rows.stop - rows.start)).astype(np.int64))
+
+def window_scaling(panel, rows: slice, sample_rows: int = 1_000_000, block_rows: int = 1_000_000) -> tuple:
+    # Center / scale of the window's RobustScaler from a sample of rows, exact mean of the target by blocks
+    scaler = RobustScaler().fit(panel.X[spread_rows(rows, sample_rows)])
+    y_sum = sum(panel.y[start:min(start + block_rows, rows.stop)].sum() for start in range(rows.start, rows.stop, block_rows))
+    return scaler.center_, scaler.scale_, y_sum / (rows.stop - rows.start)
+
+def scaled_rows(panel, rows, scaling: tuple) -> tuple:
+    # Scaled features and demeaned target of a (small) set of rows
+    center, scale, y_mean = scaling
+    return (panel.X[rows] - center) / scale, panel.y[rows] - y_mean
+
+
+class PanelBlocks(xgb.DataIter):
+    """Scaled blocks of `block_rows` rows of a panel window, fed one after another to XGBoost"""
+
+    def __init__(self, panel, rows: slice, scaling: tuple, block_rows: int = 200_000, cache_dir: str = None):
+        self.panel, self.rows, self.scaling, self.block_rows = panel, rows, scaling, block_rows
+        self.starts = list(range(rows.start, rows.stop, block_rows))
+        self.position = 0
+        super().__init__(cache_prefix=os.path.join(cache_dir or tempfile.gettempdir(), 'xgb_external'))
+
+    def next(self, input_data) -> bool:
+        if self.position == len(self.starts):
+            return False
+        start = self.starts[self.position]
+        X, y = scaled_rows(self.panel, slice(start, min(start + self.block_rows, self.rows.stop)), self.scaling)
+        input_data(data=X, label=y)
+        self.position += 1
+        return True
+
+    def reset(self):
+        self.position = 0
+
+
+def fit_external(panel, rows: slice, scaling: tuple, params: dict, block_rows: int = 200_000, cache_dir: str = None,
+                 **xgb_kwargs) -> BoosterModel:
+    """Train the XGBoost `params` on the window `rows` of `panel` streamed from disk by blocks"""
+    with tempfile.TemporaryDirectory(dir=cache_dir) as pages_dir:
+        dtrain = xgb.ExtMemQuantileDMatrix(PanelBlocks(panel, rows, scaling, block_rows, pages_dir))
+        booster = xgb.train(native_params(params, **xgb_kwargs), dtrain, num_boost_round=params.get('n_estimators', 100))
+        del dtrain
+    return BoosterModel(booster, params)
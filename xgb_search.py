@@ -0,0 +1,116 @@
+import time
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit
+
+# Budgeted alternative to the exhaustive XGBoost GridSearchCV of `predict_data.py`:
+# - `n_estimators` is not searched, every candidate trains up to the largest value with early stopping on a validation fold
+# - the validation fold is the most recent part of the (date-sorted) training window, like the last `TimeSeriesSplit` fold,
+#   or the last fold of `cv` when given (e.g. the month-grouped, purged folds of `cv_splits.MonthFolds`)
+# - candidates are tried starting from the previous window's winner and its one-parameter neighbours,
+#   since the winning configuration rarely changes from one year to the next
+# - the search stops starting new candidates once `time_budget` seconds are spent (the first one always runs)
+#
+# Both searches quantize each training matrix once: the histogram `QuantileDMatrix` of a fold (and the validation
+# matrix, with the fold's bins) is built before the candidates and shared by all of them, instead of XGBoost
+# sketching the same rows again for every configuration. Candidates that only differ by `n_estimators` are one
+# model: the smaller values are scored on the first trees of the largest one (`iteration_range`).
+
+def candidate_order(param_grid: dict, seed_params: dict = None) -> list:
+    # All combinations of the grid, the ones closest to `seed_params` (fewest differing values) first
+    candidates = list(ParameterGrid(param_grid))
+    if seed_params:
+        candidates.sort(key=lambda params: sum(params.get(k) != v for k, v in seed_params.items() if k in param_grid))
+    return candidates
+
+class BoosterModel:
+    """Booster trained with `xgb.train`, with the `predict` / `get_booster` of a fitted XGBRegressor"""
+
+    def __init__(self, booster, params):
+        self.booster, self.params = booster, params
+
+    def predict(self, X):
+        # In-place prediction on the array, without building a DMatrix
+        return self.booster.inplace_predict(X)
+
+    def get_booster(self):
+        return self.booster
+
+def native_params(params: dict, **xgb_kwargs) -> dict:
+    # `xgb.train` parameters of the XGBRegressor arguments (`n_estimators` is the number of rounds, None means default)
+    names = {'random_state': 'seed', 'n_jobs': 'nthread'}
+    return {names.get(k, k): v for k, v in {**xgb_kwargs, **params}.items() if k != 'n_estimators' and v is not None}
+
+def fit_quantized(X: np.ndarray, y: np.ndarray, params: dict, **xgb_kwargs) -> BoosterModel:
+    # Refit of the chosen parameters on the window, quantized once
+    booster = xgb.train(native_params(params, **xgb_kwargs), xgb.QuantileDMatrix(X, y), num_boost_round=params.get('n_estimators', 100))
+    return BoosterModel(booster, params)
+
+def as_slice(index: np.ndarray):
+    # A slice for a range of consecutive row indices, the indices unchanged otherwise
+    if len(index) and index[-1] - index[0] + 1 == len(index) and np.all(np.diff(index) == 1):
+        return slice(int(index[0]), int(index[-1]) + 1)
+    return index
+
+def quantized_grid_search(X: np.ndarray, y: np.ndarray, param_grid: dict, cv=None, **xgb_kwargs) -> dict:
+    """Exhaustive search of `param_grid` with the folds of `cv` (3 `TimeSeriesSplit` folds by default)
+
+    Same choice as `GridSearchCV(..., scoring='neg_mean_squared_error')`: the lowest mean MSE over the folds,
+    the first candidate of the grid on ties.
+    """
+    start = time.perf_counter()
+    cv = cv if cv is not None else TimeSeriesSplit(n_splits=3)
+    candidates = list(ParameterGrid(param_grid))
+
+    # Candidates grouped by everything but `n_estimators`, each group trained once up to its largest value
+    groups = {}
+    for i, params in enumerate(candidates):
+        key = tuple(sorted((k, v) for k, v in params.items() if k != 'n_estimators'))
+        groups.setdefault(key, []).append(i)
+
+    mse = np.zeros((len(candidates), cv.get_n_splits()))
+    for fold, (train, test) in enumerate(cv.split(X)):
+        # Contiguous folds (time-series splits of date-sorted rows) are sliced as views instead of copied
+        train, test = as_slice(train), as_slice(test)
+        dtrain = xgb.QuantileDMatrix(X[train], y[train])
+        for key, members in groups.items():
+            rounds = [candidates[i].get('n_estimators', 100) for i in members]
+            booster = xgb.train(native_params(dict(key), **xgb_kwargs), dtrain, num_boost_round=max(rounds))
+            for i, n_rounds in zip(members, rounds):
+                mse[i, fold] = np.mean((booster.inplace_predict(X[test], iteration_range=(0, n_rounds)) - y[test]) ** 2)
+
+    best = int(np.argmin(mse.mean(axis=1)))
+    return {'params': candidates[best], 'val_rmse': np.sqrt(mse[best].mean()), 'evaluated': len(candidates),
+            'candidates': len(candidates), 'seconds': time.perf_counter() - start}
+
+def budgeted_search(X: np.ndarray, y: np.ndarray, param_grid: dict, seed_params: dict = None, time_budget: float = 0,
+                    early_stopping_rounds: int = 50, validation_fraction: float = 0.25, cv=None, **xgb_kwargs) -> dict:
+    start = time.perf_counter()
+
+    param_grid = dict(param_grid)
+    max_rounds = max(param_grid.pop('n_estimators', [1000]))
+    candidates = candidate_order(param_grid, seed_params)
+
+    # Most recent rows of the window are the validation fold
+    if cv is not None:
+        fit, val = (as_slice(index) for index in list(cv.split(X))[-1])
+    else:
+        split = int(len(X) * (1 - validation_fraction))
+        fit, val = slice(0, split), slice(split, len(X))
+    dfit = xgb.QuantileDMatrix(X[fit], y[fit])
+    dval = xgb.QuantileDMatrix(X[val], y[val], ref=dfit)
+
+    best = None
+    evaluated = 0
+    for params in candidates:
+        if evaluated and time_budget and time.perf_counter() - start > time_budget:
+            break
+
+        booster = xgb.train(native_params(params, **xgb_kwargs), dfit, num_boost_round=max_rounds, evals=[(dval, 'validation')],
+                            early_stopping_rounds=early_stopping_rounds, verbose_eval=False)
+        evaluated += 1
+
+        if best is None or booster.best_score < best['val_rmse']:
+            best = {'params': {**params, 'n_estimators': booster.best_iteration + 1}, 'val_rmse': booster.best_score}
+
+    return {**best, 'evaluated': evaluated, 'candidates': len(candidates), 'seconds': time.perf_counter() - start}